@@ -0,0 +1,212 @@
+import heapq
+import itertools
+from SokobanSolver import SokobanSolver
+import lib.cache
+from lib.matching import min_cost_matching, UNREACHABLE
+
+class SokobanSearch(SokobanSolver):
+    """ Explicit state search over pushes, no SAT solver needed.
+
+        A state is the set of box squares, kept as a bitmask of box cells,
+        and the player: its exact square when minimizing moves, the
+        smallest square of the area it can walk to when minimizing pushes.
+        Successors are the pushes the player can walk to, costing the walk
+        plus one or just one. The heuristic is the minimum cost matching of
+        boxes to targets by push distance. A transposition table keeps the
+        cheapest cost found for every state.
+
+        Shares the map loading, level index and plan formatting with
+        SokobanSolver, so the plans are printed the same way.
+    """
+
+    ALGORITHMS = ('astar', 'idastar')
+    METRICS = ('moves', 'pushes')
+
+    def __init__(self, map_name, algorithm='astar', metric='moves', prune_dead=True, level=0,
+                 cache=None, cache_size=lib.cache.MAX_SIZE):
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError('Unknown search algorithm: {}'.format(algorithm))
+        if metric not in self.METRICS:
+            raise ValueError('Unknown metric: {}'.format(metric))
+        self.algorithm = algorithm
+        self.metric = metric
+        super(SokobanSearch, self).__init__(map_name, prune_dead=prune_dead, reachability=False,
+                                            boxes='unlabeled', level=level,
+                                            semantics='push' if metric == 'pushes' else 'sequential',
+                                            cache=cache, cache_size=cache_size)
+        self.box_bits = {XY: 1 << i for i, XY in enumerate(self.box_cells)}
+        self.targets = [XY for XY in self.level.targets if XY in self.cell_ids]
+        self.distances = [self.push_distances(target) for target in self.targets]
+        self.heuristics = {}
+        self.table = {}
+        self.expanded = 0
+
+    def options(self):
+        return {
+            'algorithm': self.algorithm,
+            'metric': self.metric,
+            'prune_dead': self.prune_dead,
+            'cache': self.cache_dir,
+            'cache_size': self.cache_size
+        }
+
+    def cache_key(self):
+        # costs of searched plans are not SAT horizons, the search keeps its own entries
+        options = {'backend': 'search', 'algorithm': self.algorithm, 'metric': self.metric,
+                   'prune_dead': self.prune_dead}
+        return lib.cache.ResultCache.key(self.level, options)
+
+    def open_theory(self):
+        self.step_marks = []
+        self.theory = None
+
+    def set_workdir(self, workdir):
+        """ The search writes no files. """
+
+    def solve_linear(self):
+        print('Searching ({}, {}) ...'.format(self.algorithm, self.metric))
+        self.expanded = 0
+        if self.algorithm == 'astar':
+            pushes = self.astar()
+        else:
+            pushes = self.idastar()
+        print('Expanded {} states'.format(self.expanded))
+        if pushes is None:
+            return (False, [])
+        actions = [(step+1, 'push_t' if self.level.is_target(push[2]) else 'push', None, push)
+                   for step, push in enumerate(pushes)]
+        plan = self.format_plan(actions)
+        self.plan_horizon = len(pushes) if self.metric == 'pushes' else len(plan)
+        return (True, plan)
+
+    solve_scheduled = solve_linear
+
+    def astar(self):
+        """ Returns the pushes of a cheapest plan within the limit, or None. """
+        boxes = frozenset(self.level.boxes)
+        player = self.level.player
+        h = self.heuristic(boxes)
+        if h >= UNREACHABLE:
+            return None
+        self.table = {}
+        parents = {}
+        counter = itertools.count()
+        queue = [(h, h, next(counter), 0, player, boxes, self.box_mask(boxes), None)]
+        while queue:
+            f, h, _, g, player, boxes, mask, parent = heapq.heappop(queue)
+            area = self.walk_distances_around(player, boxes)
+            key = (self.player_key(player, area), mask)
+            if key in self.table and self.table[key] <= g:
+                continue
+            self.table[key] = g
+            parents[key] = parent
+            self.expanded += 1
+            if h == 0:
+                return self.trace(parents, key)
+            for push, cost in self.successors(area, boxes):
+                next_boxes = boxes - {push[1]} | {push[2]}
+                next_h = self.heuristic(next_boxes)
+                if g + cost + next_h > self.LIMIT:
+                    continue
+                next_mask = mask ^ self.box_bits[push[1]] ^ self.box_bits[push[2]]
+                heapq.heappush(queue, (g + cost + next_h, next_h, next(counter), g + cost,
+                                       push[1], next_boxes, next_mask, (key, push)))
+        return None
+
+    def idastar(self):
+        """ Returns the pushes of a cheapest plan within the limit, or None. """
+        boxes = frozenset(self.level.boxes)
+        player = self.level.player
+        threshold = self.heuristic(boxes)
+        path = []
+        while threshold <= self.LIMIT:
+            self.table = {}
+            found = self.deepen(0, threshold, player, boxes, self.box_mask(boxes), path)
+            if found is True:
+                return path
+            threshold = found
+        return None
+
+    def deepen(self, g, threshold, player, boxes, mask, path):
+        """ Depth first search below *threshold*.
+
+            Returns True with the plan left in *path*, or the smallest cost
+            beyond the threshold met.
+        """
+        h = self.heuristic(boxes)
+        if g + h > threshold:
+            return g + h
+        area = self.walk_distances_around(player, boxes)
+        key = (self.player_key(player, area), mask)
+        if key in self.table and self.table[key] <= g:
+            return UNREACHABLE
+        self.table[key] = g
+        self.expanded += 1
+        if h == 0:
+            return True
+        least = UNREACHABLE
+        successors = []
+        for push, cost in self.successors(area, boxes):
+            next_boxes = boxes - {push[1]} | {push[2]}
+            successors.append((cost + self.heuristic(next_boxes), push, cost, next_boxes))
+        successors.sort()
+        for _, push, cost, next_boxes in successors:
+            path.append(push)
+            next_mask = mask ^ self.box_bits[push[1]] ^ self.box_bits[push[2]]
+            found = self.deepen(g + cost, threshold, push[1], next_boxes, next_mask, path)
+            if found is True:
+                return True
+            path.pop()
+            least = min(least, found)
+        return least
+
+    def successors(self, area, boxes):
+        """ Yields (push, cost) for the pushes the player can walk to. """
+        for boxXY in boxes:
+            for push in self.pushes_from.get(boxXY, []):
+                if push[0] in area and push[2] not in boxes:
+                    yield (push, 1 if self.metric == 'pushes' else area[push[0]] + 1)
+
+    def heuristic(self, boxes):
+        """ Returns the pushes of a minimum cost matching of *boxes* to targets, cached. """
+        key = self.box_mask(boxes)
+        if len(self.targets) < len(boxes):
+            return UNREACHABLE
+        if key not in self.heuristics:
+            costs = [[distances.get(box, UNREACHABLE) for distances in self.distances] for box in boxes]
+            self.heuristics[key] = min(min_cost_matching(costs)[0], UNREACHABLE)
+        return self.heuristics[key]
+
+    def box_mask(self, boxes):
+        mask = 0
+        for XY in boxes:
+            mask |= self.box_bits[XY]
+        return mask
+
+    def player_key(self, player, area):
+        if self.metric == 'pushes':
+            return min(area)
+        return player
+
+    def walk_distances_around(self, start, boxes):
+        """ Returns the number of moves from *start* to the squares it can walk to around *boxes*. """
+        distances = {start: 0}
+        queue = [start]
+        for XY in queue:
+            for neighbor in self.neighbors[XY]:
+                if neighbor is not None and neighbor not in distances and neighbor not in boxes:
+                    distances[neighbor] = distances[XY] + 1
+                    queue.append(neighbor)
+        return distances
+
+    def trace(self, parents, key):
+        pushes = []
+        while parents[key] is not None:
+            key, push = parents[key]
+            pushes.append(push)
+        return pushes[::-1]
+
+
+if __name__ == "__main__":
+    ss = SokobanSearch('maps/map3.txt')
+    ss.solve()
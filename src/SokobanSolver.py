@@ -1,41 +1,184 @@
-import subprocess
-from lib.theoryWriter import TheoryWriter
+import io
+import os
+import shutil
+import collections
+import multiprocessing
+import tempfile
+import contextlib
+from lib.theoryWriter import TheoryWriter, DimacsWriter
+from lib.scheduler import HorizonScheduler
+from lib.matching import min_cost_matching, UNREACHABLE
+from lib.level import Level
+import lib.cardinality
 import lib.text2dimacs
+import lib.satsolver
+import lib.profiler
+import lib.cache
 
 class SokobanSolver(object):
 
-    MINISAT_PATH = 'lib/minisat/win/minisat.exe'
     CNF_FILE = 'cnf.txt'
     DIMACS_FILE = 'dimacs.txt'
     DIMACS_VARS_FILE = 'variables.txt'
-    MINISAT_OUT_FILE = 'out.txt'
     LIMIT = 20
+    ENCODINGS = ('dimacs', 'text')
+    FRAMES = ('explanatory', 'classic')
+    BOXES = ('labeled', 'unlabeled')
+    SEMANTICS = ('sequential', 'parallel', 'push')
+    POLL_INTERVAL = 0.05
+    # feed the SAT solvers through pipes instead of files in the work directory
+    PIPES = os.name == 'posix'
+    # memory backed file system preferred for the work directory
+    TMPFS = '/dev/shm'
+    DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+    # options that change the theory of a horizon, the key of cached results
+    CACHED_OPTIONS = ('encoding', 'cardinality', 'frame', 'prune_dead', 'reachability', 'boxes', 'semantics')
 
-    def __init__(self, map_name):
+    def __init__(self, map_name, encoding='dimacs', incremental=True,
+                 jobs=1, schedule='window', minimal=False, cardinality='sequential',
+                 frame='explanatory', prune_dead=True, reachability=True, lower_bound=True,
+                 boxes='labeled', semantics='sequential', level=0, encode_jobs=1, solvers=('minisat',),
+                 profile=None, cache=None, cache_size=lib.cache.MAX_SIZE):
+        if encoding not in self.ENCODINGS:
+            raise ValueError('Unknown encoding: {}'.format(encoding))
+        if cardinality not in lib.cardinality.ENCODINGS:
+            raise ValueError('Unknown cardinality encoding: {}'.format(cardinality))
+        if frame not in self.FRAMES:
+            raise ValueError('Unknown frame axioms: {}'.format(frame))
+        if schedule not in HorizonScheduler.STRATEGIES:
+            raise ValueError('Unknown schedule: {}'.format(schedule))
+        if boxes not in self.BOXES:
+            raise ValueError('Unknown box encoding: {}'.format(boxes))
+        if boxes == 'unlabeled' and frame == 'classic':
+            raise ValueError('Unlabeled boxes need explanatory frame axioms')
+        if semantics not in self.SEMANTICS:
+            raise ValueError('Unknown step semantics: {}'.format(semantics))
+        if semantics != 'sequential' and frame == 'classic':
+            raise ValueError('Parallel and push steps need explanatory frame axioms')
         self.map_name = map_name
-        self.map_data = {}
-        self.load_map(map_name)
-        self.coords = self.generate_coords()
-        self.theory = TheoryWriter(self.CNF_FILE)
-    
+        self.encoding = encoding
+        self.incremental = incremental
+        self.jobs = jobs
+        self.schedule = schedule
+        self.minimal = minimal
+        self.cardinality = cardinality
+        self.frame = frame
+        self.prune_dead = prune_dead
+        self.reachability = reachability
+        self.use_lower_bound = lower_bound
+        self.first_horizon = 1
+        self.labeled = boxes == 'labeled'
+        self.semantics = semantics
+        self.encode_jobs = encode_jobs
+        self.solvers = list(solvers)
+        self.backends = [lib.satsolver.backend(spec) for spec in self.solvers]
+        self.answer = None
+        self.answered_by = None
+        self.statistics = {}
+        self.profile = profile
+        self.profiler = lib.profiler.Profiler([lib.profiler.JsonLines(profile)] if profile else [])
+        self.cache_dir = cache
+        self.cache_size = cache_size
+        self.cache = lib.cache.ResultCache(cache, cache_size) if cache else None
+        self.unsat_horizons = set()
+        self.plan_horizon = None
+        self.step_families = {}
+        self.goal_families = collections.Counter()
+        self.family_counts = collections.Counter()
+        self.encoder = None
+        self.cuts = []
+        self.cancelled = None
+        self.step_marks = []
+        self.theory = None
+        self.workdir = None
+        self.own_workdir = False
+        self.dimacs = None
+        self.variables = None
+        if isinstance(map_name, Level):
+            self.level = map_name
+        else:
+            levels = Level.load(map_name)
+            if not 0 <= level < len(levels):
+                raise ValueError('{} has {} levels, no level {}'.format(map_name, len(levels), level+1))
+            self.level = levels[level]
+        self.coords = self.level.squares(self.level.floor)
+        self.build_level_index()
+        self.build_variable_layout()
+        self.layers = [({self.level.player}, [{box} for box in self.level.boxes])]
+        self.open_theory()
+
+    def options(self):
+        """ Returns the keyword arguments this solver was created with. """
+        return {
+            'encoding': self.encoding,
+            'incremental': self.incremental,
+            'jobs': self.jobs,
+            'schedule': self.schedule,
+            'minimal': self.minimal,
+            'cardinality': self.cardinality,
+            'frame': self.frame,
+            'prune_dead': self.prune_dead,
+            'reachability': self.reachability,
+            'lower_bound': self.use_lower_bound,
+            'boxes': 'labeled' if self.labeled else 'unlabeled',
+            'semantics': self.semantics,
+            'encode_jobs': self.encode_jobs,
+            'solvers': self.solvers,
+            'profile': self.profile,
+            'cache': self.cache_dir,
+            'cache_size': self.cache_size
+        }
+
+    def open_theory(self):
+        """ Opens the theory in memory when piping, otherwise in the work directory. """
+        self.step_marks = []
+        if self.PIPES:
+            self.theory = self.new_writer(None, comments=False)
+        elif self.encoding == 'dimacs':
+            self.theory = self.new_writer(self.work_file(self.DIMACS_FILE), comments=False)
+        else:
+            self.theory = self.new_writer(self.work_file(self.CNF_FILE), comments=True)
+
+    def new_writer(self, filename, comments):
+        if self.encoding == 'dimacs':
+            return DimacsWriter(filename, comments)
+        return TheoryWriter(filename, comments)
+
     def set_limit(self, limit):
         self.LIMIT = limit
 
+    def work_file(self, name):
+        """ Returns the path of *name* in the work directory, creating a private one if none was set. """
+        if self.workdir is None:
+            tmpfs = self.TMPFS if os.path.isdir(self.TMPFS) else None
+            self.workdir = tempfile.mkdtemp(prefix='sokoban-', dir=tmpfs)
+            self.own_workdir = True
+        return os.path.join(self.workdir, name)
+
+    def set_workdir(self, workdir):
+        """ Moves the files written while solving to the directory *workdir*. """
+        self.close()
+        self.workdir = workdir
+        self.open_theory()
+
+    def close(self):
+        """ Closes the theory, the encoder pool and removes the private work directory. """
+        if self.theory is not None:
+            self.theory.close()
+        if self.encoder is not None:
+            self.encoder.terminate()
+            self.encoder.join()
+            self.encoder = None
+        if self.own_workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+        self.workdir = None
+        self.own_workdir = False
+
     def solve(self):
-        solution_found = False
-        iteration = 1
-        solution = []
-        while not solution_found and iteration <= self.LIMIT:
-            print('> ITERATION: {}'.format(iteration))
-            print('Writing theory ...')
-            self.encode_iteration(iteration)
-            print('Translating to DIMACS ...')
-            self.translate_to_dimacs()
-            print('Solving ...')
-            self.run_minisat()
-            solution_found, solution = self.process_solution()
-            iteration += 1
-        self.theory.close()
+        try:
+            solution_found, solution = self.find_plan()
+        finally:
+            self.close()
         print('DONE')
         if solution_found:
             print('Solution found, actions:')
@@ -44,394 +187,1255 @@ class SokobanSolver(object):
         else:
             print('Solution not found. Limit of steps reached ({})'.format(self.LIMIT))
 
-    def run_minisat(self):
-        args = (self.MINISAT_PATH, self.DIMACS_FILE, self.MINISAT_OUT_FILE)
-        popen = subprocess.Popen(args, stdout=subprocess.PIPE)
-        popen.wait()
+    def cache_key(self):
+        options = self.options()
+        return lib.cache.ResultCache.key(self.level, {name: options[name] for name in self.CACHED_OPTIONS})
+
+    def scheduled(self):
+        return self.jobs > 1 or self.schedule != 'window'
+
+    def find_plan(self):
+        """ Returns a pair (solution_found, solution) with the plan as action strings. """
+        cached = self.cache.get(self.cache_key()) if self.cache is not None else None
+        self.unsat_horizons = set(cached['unsat']) if cached else set()
+        self.plan_horizon = None
+        if cached and cached['sat']:
+            horizon = cached['sat']['horizon']
+            if cached['sat']['minimal'] and horizon > self.LIMIT:
+                print('Shortest plan in the cache has {} steps'.format(horizon))
+                return (False, [])
+            if horizon <= self.LIMIT and (cached['sat']['minimal'] or self.scheduled() and not self.minimal):
+                print('Plan with {} steps found in the cache'.format(horizon))
+                return (True, cached['sat']['plan'])
+        if self.prune_dead:
+            print('Dead squares: {} of {}, pushes pruned: {} of {}'.format(
+                len(self.dead_squares), len(self.coords),
+                self.push_count - len(self.pushes), self.push_count))
+        self.first_horizon = 1
+        if self.use_lower_bound:
+            bound = self.lower_bound()
+            print('Lower bound on plan length: {}'.format(bound if bound < UNREACHABLE else 'unreachable'))
+            self.first_horizon = max(1, bound)
+        if self.first_horizon in self.unsat_horizons:
+            while self.first_horizon in self.unsat_horizons:
+                self.first_horizon += 1
+            print('Horizons up to {} unsatisfiable in the cache'.format(self.first_horizon - 1))
+        if self.scheduled():
+            solution_found, solution = self.solve_scheduled()
+        else:
+            solution_found, solution = self.solve_linear()
+        if self.cache is not None:
+            sat = None
+            if solution_found:
+                sat = {'horizon': self.plan_horizon, 'plan': solution,
+                       'minimal': not self.scheduled() or self.minimal}
+            self.cache.update(self.cache_key(), self.unsat_horizons, sat)
+        return (solution_found, solution)
+
+    def solve_linear(self):
+        self.step_marks = []
+        solution_found = False
+        iteration = self.first_horizon
+        solution = []
+        while not solution_found and iteration <= self.LIMIT:
+            print('> ITERATION: {}'.format(iteration))
+            if iteration in self.unsat_horizons:
+                print('Unsatisfiable in the cache, skipping')
+                iteration += 1
+                continue
+            if not self.goal_reachable(iteration):
+                print('Goal not reachable in {} steps, skipping'.format(iteration))
+                self.unsat_horizons.add(iteration)
+                iteration += 1
+                continue
+            solution = None
+            self.profiler.start(map=self.level.name, horizon=iteration)
+            while solution is None:
+                print('Writing theory ...')
+                with self.profiler.phase('encode'):
+                    self.encode_iteration(iteration)
+                if self.encoding == 'text':
+                    print('Translating to DIMACS ...')
+                    with self.profiler.phase('translate'):
+                        self.translate_to_dimacs()
+                print('Solving ...')
+                with self.profiler.phase('solve'):
+                    self.run_solver()
+                if len(self.backends) > 1:
+                    print('Answered by {}'.format(self.answered_by))
+                with self.profiler.phase('decode'):
+                    solution_found, solution = self.process_solution()
+                if solution is None:
+                    print('Player cannot walk to a push, refining ...')
+            self.finish_record(iteration, solution_found)
+            if solution_found:
+                self.plan_horizon = iteration
+            else:
+                self.unsat_horizons.add(iteration)
+            iteration += 1
+        self.theory.close()
+        return (solution_found, solution)
+
+    def solve_scheduled(self):
+        """ Probes horizons on a pool of *jobs* worker processes. """
+        print('Probing horizons up to {} ({} schedule, {} jobs) ...'.format(self.LIMIT, self.schedule, self.jobs))
+        workdir = tempfile.mkdtemp(prefix='sokoban-')
+        options = dict(self.options(), jobs=1, encode_jobs=1, cache=None)
+        scheduler = HorizonScheduler(probe_worker, init_worker, (self.level, options, workdir),
+                                     self.LIMIT, self.jobs, self.schedule, self.minimal,
+                                     report=self.report_probe, first=self.first_horizon)
+        try:
+            horizon, solution = scheduler.run()
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        if horizon is None:
+            return (False, [])
+        print('Plan found with {} steps{}'.format(horizon, ' (shortest)' if self.minimal else ''))
+        self.plan_horizon = horizon
+        return (True, solution)
+
+    def report_probe(self, horizon, solution_found):
+        print('> ITERATION: {} {}'.format(horizon, 'SAT' if solution_found else 'UNSAT'))
+        if solution_found is False:
+            self.unsat_horizons.add(horizon)
+
+    def probe(self, iteration):
+        """ Encodes and solves a single horizon.
+
+            Returns a pair (solution_found, solution), solution_found is None
+            if the solver was cancelled.
+        """
+        if not self.goal_reachable(iteration):
+            return (False, [])
+        self.profiler.start(map=self.level.name, horizon=iteration)
+        while True:
+            with self.profiler.phase('encode'):
+                self.encode_iteration(iteration)
+            if self.encoding == 'text':
+                with self.profiler.phase('translate'):
+                    self.translate_to_dimacs()
+            with self.profiler.phase('solve'):
+                solved = self.run_solver()
+            if not solved:
+                self.finish_record(iteration, None)
+                return (None, [])
+            with self.profiler.phase('decode'):
+                solution_found, solution = self.process_solution()
+            if solution is not None:
+                self.finish_record(iteration, solution_found)
+                return (solution_found, solution)
+
+    def finish_record(self, iteration, solution_found):
+        """ Completes the profiler record of *iteration* with the sizes of the theory and the solver statistics. """
+        if not self.profiler.hooks:
+            return
+        result = {None: 'cancelled', True: 'sat', False: 'unsat'}[solution_found]
+        self.profiler.finish(result=result, encoding=self.encoding, semantics=self.semantics,
+                             boxes='labeled' if self.labeled else 'unlabeled',
+                             variables=self.variable_kinds(iteration), clauses=self.clause_families(iteration),
+                             size=self.dimacs_size(), cuts=len(self.cuts), solver=self.answered_by,
+                             statistics=self.statistics if solution_found is not None else {})
+
+    def run_solver(self):
+        """ Runs the SAT solvers on the theory, returns False if it was cancelled.
+
+            When piping, the dimacs is written to the standard input of the
+            solvers, otherwise they read the file in the work directory.
+        """
+        if self.PIPES:
+            theory = (self.theory.getvalue() if self.encoding == 'dimacs' else self.dimacs).encode()
+        else:
+            theory = self.work_file(self.DIMACS_FILE)
+        answer = lib.satsolver.solve(self.backends, theory, self.workdir, self.cancelled, self.POLL_INTERVAL)
+        if answer is None:
+            return False
+        backend, sat, model, self.statistics = answer
+        self.answer = (sat, model)
+        self.answered_by = backend.name
+        return True
 
     def translate_to_dimacs(self):
-        lib.text2dimacs.translate(self.CNF_FILE, self.DIMACS_FILE)
+        if self.PIPES:
+            dimacs = io.StringIO()
+            variables = lib.text2dimacs.translate(io.StringIO(self.theory.getvalue()), dimacs, None,
+                                                  comments=False)
+            self.dimacs = dimacs.getvalue()
+        else:
+            variables = lib.text2dimacs.translate(self.work_file(self.CNF_FILE), self.work_file(self.DIMACS_FILE),
+                                                  self.work_file(self.DIMACS_VARS_FILE), comments=False)
+        self.variables = {var: name for name, var in variables.items()}
 
     def process_solution(self):
-        output = ''
-        with open(self.MINISAT_OUT_FILE) as f:
-            sat = f.readline().strip()
-            if sat == 'UNSAT':
-                return (False, [])
-            output = f.readline().strip()
-        minisat_vars = output.split()
-        predicates = {}
-        var = 0
+        """ Reads the model found by the SAT solver.
+
+            Returns a pair (solution_found, solution). The solution is None
+            if the player cannot walk to one of the pushes, the horizon has
+            to be solved again with the cut added by format_plan.
+        """
+        sat, model = self.answer
+        if not sat:
+            return (False, [])
+        if self.encoding == 'dimacs':
+            return (True, self.decode_actions(model))
         res = []
-        with open(self.DIMACS_VARS_FILE) as f:
-            for line in f:
-                line = line.strip()
-                if var == 0:
-                    var = int(line)
-                    continue
-                predicates[var] = line
-                var = 0
-        for v in minisat_vars:
-            v_int = int(v)
+        for v_int in model:
             if v_int > 0:
-                pred = predicates.get(v_int, 'null')
+                pred = self.variables.get(v_int, 'null')
                 if (pred.startswith('move') or pred.startswith('push') or pred.startswith('push_t')):
-                    res.append(pred)
-        return (True, res)
+                    name, args = self.parse_action(pred)
+                    if name == 'move':
+                        res.append((args[-1], name, None, args[:2]))
+                    else:
+                        res.append((args[-1], name, args[0], args[1:4]))
+        return (True, self.format_plan(res))
+
+    def decode_actions(self, model):
+        """ Maps the true action variables of a model back to action strings, ordered by step."""
+        res = []
+        for v in model:
+            if v <= len(self.coords):
+                continue
+            step, offset = divmod(v - len(self.coords) - 1, self.step_size)
+            offset -= self.fluent_size
+            if offset < 0 or offset >= self.action_size:
+                continue
+            step += 1
+            if offset < self.walk_size:
+                if self.semantics != 'push':
+                    res.append((step, 'move', None, self.moves[offset]))
+                continue
+            offset -= self.walk_size
+            kind, offset = divmod(offset, len(self.pushes) * self.box_count)
+            box_id, offset = divmod(offset, len(self.pushes))
+            res.append((step, 'push_t' if kind else 'push', box_id+1, self.pushes[offset]))
+        return self.format_plan(res)
+
+    def format_plan(self, actions):
+        """ Formats decoded (step, name, box_id, squares) tuples as a sequential plan.
+
+            In the sequential semantics every step is a single move or push.
+            The parallel semantics only fixes where the player starts and
+            where it pushes within a step, and the push semantics has no
+            moves at all, so their moves are dropped and a shortest walk to
+            every push is found on the replayed map instead. Returns None and
+            adds a cut if there is no such walk. Actions are numbered from
+            one. In the unlabeled encoding the boxes are named after their
+            initial positions by replaying the pushes.
+        """
+        steps = {}
+        for step, name, box_id, squares in actions:
+            moves, pushes = steps.setdefault(step, ({}, []))
+            if name == 'move':
+                moves[squares[0]] = squares[1]
+            else:
+                pushes.append((name, box_id, squares))
+        boxes = {XY: index+1 for index, XY in enumerate(self.level.boxes)}
+        playerXY = self.level.player
+        res = []
+        for step in sorted(steps):
+            moves, pushes = steps[step]
+            while self.semantics == 'sequential' and playerXY in moves:
+                res.append(self.move_name(playerXY, moves[playerXY], len(res)+1))
+                playerXY = moves.pop(playerXY)
+            for name, box_id, (pushXY, fromXY, toXY) in pushes:
+                if playerXY != pushXY:
+                    walk = self.walk_path(playerXY, pushXY, boxes)
+                    if walk is None:
+                        self.add_cut(step, playerXY, boxes)
+                        return None
+                    for XY in walk:
+                        res.append(self.move_name(playerXY, XY, len(res)+1))
+                        playerXY = XY
+                label = boxes.pop(fromXY)
+                boxes[toXY] = label
+                if not self.labeled:
+                    box_id = label
+                name = self.push_t_name if name == 'push_t' else self.push_name
+                res.append(name(box_id, pushXY, fromXY, toXY, len(res)+1))
+                playerXY = fromXY
+        return res
+
+    def walk_path(self, startXY, endXY, boxes):
+        """ Returns the squares of a shortest walk from *startXY* to *endXY* around *boxes*, or None. """
+        previous = {startXY: None}
+        queue = collections.deque([startXY])
+        while queue:
+            XY = queue.popleft()
+            if XY == endXY:
+                path = []
+                while XY != startXY:
+                    path.append(XY)
+                    XY = previous[XY]
+                return path[::-1]
+            for neighbor in self.neighbors[XY]:
+                if neighbor is not None and neighbor not in previous and neighbor not in boxes:
+                    previous[neighbor] = XY
+                    queue.append(neighbor)
+        return None
+
+    def add_cut(self, step, playerXY, boxes):
+        """ Rules out the reach variables of *step* outside the area the player is enclosed in.
+
+            The area the player can walk to is bounded by walls and the boxes
+            next to it, as long as those boxes stay, none of the squares
+            outside is reachable. *boxes* maps squares to box labels.
+        """
+        area = self.walk_area([playerXY], boxes)
+        border = set(neighbor for XY in area for neighbor in self.neighbors[XY] if neighbor in boxes)
+        clause = [self.neg(self.player(playerXY, step-1))]
+        for XY in sorted(border):
+            clause.append(self.neg(self.at(boxes[XY] if self.labeled else 1, XY, step-1)))
+        for XY in self.coords:
+            if XY not in area:
+                self.cuts.append((step, clause + [self.neg(self.reach(XY, step))]))
+
+    def encode_cuts(self, iteration):
+        if not self.cuts:
+            return
+        self.theory.writeComment('Cuts - hrac sa nedostane von z uzavretej oblasti')
+        self.theory.writeClauses(clause for step, clause in self.cuts if step <= iteration)
+
+    def encode_goal_and_cuts(self, iteration):
+        with self.family('goal'):
+            self.encode_goal(iteration)
+        with self.family('cuts'):
+            self.encode_cuts(iteration)
 
     def encode_iteration(self, iteration):
+        if not self.incremental:
+            self.theory.new_iteration()
+            self.theory.writeComment('Map: {}'.format(self.level.name))
+            self.family_counts = self.goal_families = collections.Counter()
+            self.encode_goal_and_cuts(iteration)
+            self.family_counts = self.step_families[0] = collections.Counter()
+            with self.family('init'):
+                self.encode_init_state()
+            self.encode_steps(range(1, iteration+1))
+        else:
+            if not self.step_marks:
+                self.theory.new_iteration()
+                self.theory.writeComment('Map: {}'.format(self.level.name))
+                self.family_counts = self.step_families[0] = collections.Counter()
+                with self.family('init'):
+                    self.encode_init_state()
+                self.step_marks.append(self.theory.mark())
+            else:
+                del self.step_marks[iteration+1:]
+                self.theory.rewind(self.step_marks[-1])
+            self.encode_steps(range(len(self.step_marks), iteration+1))
+            self.family_counts = self.goal_families = collections.Counter()
+            self.encode_goal_and_cuts(iteration)
+        if self.encoding == 'dimacs':
+            self.theory.finish(self.variable_count(iteration))
+        else:
+            self.theory.flush()
+
+    def encode_steps(self, steps):
+        """ Encodes *steps* in order, on the encoder pool if there are several.
+
+            The rules of a step only depend on the step, so the workers
+            encode whole steps and their blocks are appended in order; the
+            theory is the same as when encoding serially.
+        """
+        if self.encode_jobs > 1 and len(steps) > 1:
+            blocks = self.encoder_pool().imap(encode_worker, steps)
+        else:
+            blocks = None
+        for step in steps:
+            if blocks is None:
+                self.encode_step(step)
+            else:
+                block, self.step_families[step] = next(blocks)
+                self.theory.writeBlock(block)
+            if self.incremental:
+                self.step_marks.append(self.theory.mark())
+
+    def encoder_pool(self):
+        if self.encoder is None:
+            options = dict(self.options(), jobs=1, encode_jobs=1, profile=None, cache=None)
+            self.encoder = multiprocessing.Pool(self.encode_jobs, init_encoder,
+                                                (self.level, options, self.theory.comments))
+        return self.encoder
+
+    def step_block(self, step):
+        """ Returns the rules of *step* written to an empty theory, see TheoryWriter.writeBlock,
+            and their clause counts by family.
+        """
         self.theory.new_iteration()
-        self.theory.writeComment('Map: {}'.format(self.map_name))
-        self.encode_goal(iteration)
-        self.encode_init_state()
-        for step in range(1, iteration+1):
-            self.theory.writeComment('RULES - STEP {}'.format(step))
-            self.theory.writeComment('Na jednom policku moze byt bud hrac alebo nic alebo nejaky z boxov')
+        mark = self.theory.mark()
+        self.encode_step(step)
+        return (self.theory.block(mark), self.step_families[step])
+
+    def encode_step(self, step):
+        self.aux_step = step
+        self.aux_used = 0
+        self.family_counts = self.step_families[step] = collections.Counter()
+        self.select_actions(step)
+        self.theory.writeComment('RULES - STEP {}'.format(step))
+        self.theory.writeComment('Na jednom policku moze byt bud hrac alebo nic alebo nejaky z boxov')
+        with self.family('occupancy'):
             for XY in self.coords:
                 clause = [self.empty(XY, step), self.player(XY, step)]
-                for box_id in range(len(self.map_data['boxes'])):
-                    clause.append(self.at(box_id+1, XY, step))
+                if XY in self.box_cell_ids:
+                    for box_id in range(self.box_count):
+                        clause.append(self.at(box_id+1, XY, step))
                 self.theory.writeClause(clause)
+        with self.family('exclusivity'):
             self.player_exlusivity(step)
             self.box_exclusivity(step)
             self.position_exclusivity(step)
+        with self.family('actions'):
             self.actions(step)
+        with self.family('frame'):
+            self.frame_problem(step)
+        if self.reachability:
+            with self.family('reachability'):
+                self.unreachable_fluents(step)
+
+    @contextlib.contextmanager
+    def family(self, name):
+        """ Counts the clauses written in the block to the constraint family *name*. """
+        start = self.theory.clauses
+        yield
+        self.family_counts[name] += self.theory.clauses - start
+
+    def dimacs_size(self):
+        """ Returns the size of the dimacs given to the solver in characters. """
+        if self.encoding == 'dimacs':
+            return self.theory.mark()[0]
+        if self.PIPES:
+            return len(self.dimacs)
+        return os.path.getsize(self.work_file(self.DIMACS_FILE))
+
+    def clause_families(self, iteration):
+        """ Returns the number of clauses of each constraint family in the theory of *iteration*. """
+        counts = collections.Counter(self.goal_families)
+        for step in range(iteration+1):
+            counts.update(self.step_families.get(step, {}))
+        return dict(counts)
+
+    def variable_kinds(self, iteration):
+        """ Returns the number of variables of each predicate in the theory of *iteration*.
+
+            The dimacs encoding counts the variables allocated by the
+            layout, the text encoding those the theory names.
+        """
+        if self.encoding == 'text':
+            if self.variables is None:
+                return {}
+            return dict(collections.Counter(name.split('(')[0] for name in self.variables.values()))
+        cells = len(self.coords)
+        kinds = {
+            'target': cells,
+            'player': (iteration+1) * cells,
+            'empty': (iteration+1) * cells,
+            'at': (iteration+1) * self.box_count * len(self.box_cells),
+            'reach' if self.semantics == 'push' else 'move': iteration * self.walk_size,
+            'push': iteration * self.box_count * len(self.pushes),
+            'push_t': iteration * self.box_count * len(self.pushes),
+            'aux': iteration * self.aux_size
+        }
+        if self.labeled:
+            kinds['in_target'] = (iteration+1) * self.box_count
+        return kinds
+
+    def reachable(self, step):
+        """ Returns the squares the player and each box can occupy after *step* steps.
+
+            Layers of a relaxed planning graph: the player spreads to
+            neighboring squares and a box to the squares it can be pushed to
+            from a square the player reached, ignoring all other interactions.
+            With parallel or push steps the player walks anywhere before
+            pushing.
+        """
+        if not self.reachability:
+            return (set(self.coords), [set(self.box_cells) for box in self.level.boxes])
+        while len(self.layers) <= step:
+            players, boxes = self.layers[-1]
+            if self.semantics != 'sequential':
+                players = next_players = self.walk_area(players)
+            else:
+                next_players = set(players)
+                for XY in players:
+                    next_players.update(neighbor for neighbor in self.neighbors[XY] if neighbor is not None)
+            next_boxes = []
+            for box_squares in boxes:
+                next_box = set(box_squares)
+                for playerXY, fromXY, toXY in self.pushes:
+                    if playerXY in players and fromXY in box_squares:
+                        next_box.add(toXY)
+                next_boxes.append(next_box)
+            self.layers.append((next_players, next_boxes))
+        return self.layers[step]
+
+    def lower_bound(self):
+        """ Returns an admissible lower bound on the number of steps of a plan.
+
+            Every box needs at least as many pushes as its push distance to
+            the target assigned by a minimum cost matching, and before the
+            first push the player has to walk next to some box, unless it
+            walks within the step of the push. Returns at least UNREACHABLE
+            if some box cannot be matched to a target.
+        """
+        boxes = self.level.boxes
+        targets = [XY for XY in self.level.targets if XY in self.cell_ids]
+        if len(targets) < len(boxes):
+            return UNREACHABLE
+        costs = [[UNREACHABLE] * len(targets) for box in boxes]
+        for j, target in enumerate(targets):
+            distances = self.push_distances(target)
+            for i, box in enumerate(boxes):
+                costs[i][j] = distances.get(box, UNREACHABLE)
+        pushes, assignment = min_cost_matching(costs)
+        if pushes == 0 or pushes >= UNREACHABLE or self.semantics != 'sequential':
+            return pushes
+        walk = self.walk_distances(self.level.player)
+        push_squares = [push[0] for box in boxes for push in self.pushes_from.get(box, [])]
+        return pushes + min(walk.get(XY, UNREACHABLE) for XY in push_squares)
+
+    def push_distances(self, target):
+        """ Returns the minimal number of pushes to get a box from each square to *target*. """
+        pushes_to = {}
+        for playerXY, fromXY, toXY in self.pushes:
+            pushes_to.setdefault(toXY, []).append(fromXY)
+        distances = {target: 0}
+        queue = collections.deque([target])
+        while queue:
+            XY = queue.popleft()
+            for fromXY in pushes_to.get(XY, []):
+                if fromXY not in distances:
+                    distances[fromXY] = distances[XY] + 1
+                    queue.append(fromXY)
+        return distances
+
+    def walk_distances(self, start):
+        """ Returns the number of moves from *start* to every square, ignoring boxes. """
+        distances = {start: 0}
+        queue = collections.deque([start])
+        while queue:
+            XY = queue.popleft()
+            for neighbor in self.neighbors[XY]:
+                if neighbor is not None and neighbor not in distances:
+                    distances[neighbor] = distances[XY] + 1
+                    queue.append(neighbor)
+        return distances
+
+    def walk_area(self, squares, boxes=()):
+        """ Returns the squares the player can walk to from any of *squares* around *boxes*. """
+        passable = self.level.floor & ~self.level.board(boxes)
+        return set(self.level.squares(self.level.flood(self.level.board(squares), passable)))
+
+    def box_squares(self, step):
+        """ Returns the squares reachable after *step* steps for every box label of the encoding. """
+        boxes = self.reachable(step)[1]
+        if self.labeled:
+            return boxes
+        return [set().union(*boxes)]
+
+    def goal_reachable(self, step):
+        """ Returns False if some box cannot reach any target in *step* steps. """
+        boxes = self.reachable(step)[1]
+        return all(any(self.level.is_target(XY) for XY in box_squares) for box_squares in boxes)
+
+    def select_actions(self, step):
+        """ Selects the moves and pushes whose preconditions are reachable before *step*. """
+        if not self.reachability:
+            self.active_moves = self.moves
+            self.active_pushes = [self.pushes] * self.box_count
+            self.active_pushes_from = [self.pushes_from] * self.box_count
+            self.active_pushes_to = self.pushes_to
+        else:
+            players = self.reachable(step-1)[0]
+            if self.semantics != 'sequential':
+                players = self.walk_area(players)
+            boxes = self.box_squares(step-1)
+            self.active_moves = [move for move in self.moves if move[0] in players]
+            self.active_pushes = []
+            self.active_pushes_from = []
+            for box_squares in boxes:
+                pushes = [push for push in self.pushes if push[0] in players and push[1] in box_squares]
+                pushes_from = {XY: [] for XY in self.box_cells}
+                for push in pushes:
+                    pushes_from[push[1]].append(push)
+                self.active_pushes.append(pushes)
+                self.active_pushes_from.append(pushes_from)
+            # pushes of any box, in the order of self.pushes, a level may have no boxes
+            pushes = set().union(*self.active_pushes)
+            self.active_pushes_to = {XY: [] for XY in self.box_cells}
+            for push in self.pushes:
+                if push in pushes:
+                    self.active_pushes_to[push[2]].append(push)
+        if self.semantics == 'push':
+            self.active_moves = []
+        if self.semantics == 'parallel':
+            self.active_moves_from = {XY: [] for XY in self.coords}
+            self.active_moves_to = {XY: [] for XY in self.coords}
+            for move in self.active_moves:
+                self.active_moves_from[move[0]].append(move)
+                self.active_moves_to[move[1]].append(move)
+
+    def unreachable_fluents(self, step):
+        self.theory.writeComment('Unreachable positions and impossible actions')
+        players = self.reachable(step)[0]
+        boxes = self.box_squares(step)
+        for XY in self.coords:
+            if XY not in players:
+                self.theory.writeClause([self.neg(self.player(XY, step))])
+        for box_id, box_squares in enumerate(boxes):
+            for XY in self.box_cells:
+                if XY not in box_squares:
+                    self.theory.writeClause([self.neg(self.at(box_id+1, XY, step))])
+        if self.semantics == 'push':
+            area = self.walk_area(self.reachable(step-1)[0])
+            for XY in self.coords:
+                if XY not in area:
+                    self.theory.writeClause([self.neg(self.reach(XY, step))])
+        else:
+            active = set(self.active_moves)
+            for fromXY, toXY in self.moves:
+                if (fromXY, toXY) not in active:
+                    self.theory.writeClause([self.neg(self.move(fromXY, toXY, step))])
+        for box_id, pushes in enumerate(self.active_pushes):
+            active = set(pushes)
+            for playerXY, fromXY, toXY in self.pushes:
+                if (playerXY, fromXY, toXY) not in active:
+                    self.theory.writeClause([self.neg(self.push(box_id+1, playerXY, fromXY, toXY, step))])
+                    self.theory.writeClause([self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step))])
 
     def box_exclusivity(self, step):
+        if not self.labeled:
+            return
         self.theory.writeComment('Ak je box na nejakej pozicii, nemoze byt zaroven na druhej pozicii')
-        for box_id in range(len(self.map_data['boxes'])):
-            for c1 in range(len(self.coords)):
-                for c2 in range(c1+1, len(self.coords)):
-                    self.theory.writeClause([
-                        self.neg(self.at(box_id+1, self.coords[c1], step)),
-                        self.neg(self.at(box_id+1, self.coords[c2], step))
-                    ])
+        boxes = self.box_squares(step)
+        for box_id in range(self.box_count):
+            self.at_most_one([self.at(box_id+1, XY, step) for XY in self.box_cells if XY in boxes[box_id]])
 
     def player_exlusivity(self, step):
         self.theory.writeComment('Ak je hrac na nejakej pozicii, nemoze byt zaroven na druhej pozicii')
-        for c1 in range(len(self.coords)):
-            for c2 in range(c1 + 1, len(self.coords)):
-                self.theory.writeClause([
-                    self.neg(self.player(self.coords[c1], step)),
-                    self.neg(self.player(self.coords[c2], step))
-                ])
+        players = self.reachable(step)[0]
+        self.at_most_one([self.player(XY, step) for XY in self.coords if XY in players])
+
+    def at_most_one(self, literals):
+        self.theory.writeClauses(lib.cardinality.at_most_one(literals, self.cardinality, self.new_aux, self.neg))
+
+    def new_aux(self):
+        """ Allocates an auxiliary variable of the step being encoded. """
+        index = self.aux_used
+        self.aux_used += 1
+        if self.encoding == 'dimacs':
+            return self.aux_base(self.aux_step) + index
+        return 'aux({},{})'.format(self.aux_step, index)
 
     def position_exclusivity(self, step):
         self.theory.writeComment('Na jednom policku moze byt maximalne bud hrac, nic, box')
         for XY in self.coords:
             self.theory.writeClause([self.neg(self.player(XY, step)), self.neg(self.empty(XY, step))])
-            for box_id in range(len(self.map_data['boxes'])):
+            if XY not in self.box_cell_ids:
+                continue
+            for box_id in range(self.box_count):
                 self.theory.writeClause([self.neg(self.player(XY, step)), self.neg(self.at(box_id+1, XY, step))])
                 self.theory.writeClause([self.neg(self.empty(XY, step)), self.neg(self.at(box_id+1, XY, step))])
 
     def actions(self, step):
-        self.action_move(step)
+        if self.semantics == 'parallel':
+            self.action_walk(step)
+        elif self.semantics == 'push':
+            self.action_reach(step)
+        else:
+            self.action_move(step)
         self.action_push(step)
         self.action_push_t(step)
-        actions = []
-        for fromXY in self.coords:
-            for toXY in self.coords:
-                if self.is_adjacent(fromXY, toXY):
-                    actions.append(self.move(fromXY, toXY, step))
-        for box_id in range(len(self.map_data['boxes'])):
-            for playerXY in self.coords:
-                for fromXY in self.coords:
-                    for toXY in self.coords:
-                        if self.is_inline(playerXY, fromXY, toXY):
-                            actions.append(self.push(box_id+1, playerXY, fromXY, toXY, step))
-                            actions.append(self.push_t(box_id+1, playerXY, fromXY, toXY, step))
-        self.theory.writeComment('At least one action happens')
-        self.theory.writeClause(actions)
-        self.theory.writeComment('Actions exclusivity')
-        for action1 in range(len(actions)):
-            for action2 in range(action1+1, len(actions)):
-                if action1 != action2:
-                    self.theory.writeClause([self.neg(actions[action1]), self.neg(actions[action2])])
-        self.frame_problem(step)
+        moves = [self.move(fromXY, toXY, step) for fromXY, toXY in self.active_moves]
+        pushes = []
+        for box_id in range(self.box_count):
+            for playerXY, fromXY, toXY in self.active_pushes[box_id]:
+                pushes.append(self.push(box_id+1, playerXY, fromXY, toXY, step))
+                pushes.append(self.push_t(box_id+1, playerXY, fromXY, toXY, step))
+        if self.semantics == 'sequential':
+            self.theory.writeComment('At least one action happens')
+            self.theory.writeClause(moves + pushes)
+            self.theory.writeComment('Actions exclusivity')
+            self.at_most_one(moves + pushes)
+        else:
+            if self.semantics == 'parallel':
+                self.theory.writeComment('At least one action happens')
+                self.theory.writeClause(moves + pushes)
+                self.walk_exclusivity(step)
+            self.theory.writeComment('Najviac jeden push za krok')
+            self.at_most_one(pushes)
 
     def action_move(self, step):
         self.theory.writeComment('Action move(fromXY, toXY, step)')
-        for fromXY in self.coords:
-            for toXY in self.coords:
-                if self.is_adjacent(fromXY, toXY):
-                    # P+
+        for fromXY, toXY in self.active_moves:
+            # P+
+            self.theory.writeClause([
+                self.neg(self.move(fromXY, toXY, step)),
+                self.player(fromXY, step-1)
+            ])
+            self.theory.writeClause([
+                self.neg(self.move(fromXY, toXY, step)),
+                self.empty(toXY, step-1)
+            ])
+            # E+
+            self.theory.writeClause([
+                self.neg(self.move(fromXY, toXY, step)),
+                self.player(toXY, step)
+            ])
+            self.theory.writeClause([
+                self.neg(self.move(fromXY, toXY, step)),
+                self.empty(fromXY, step)
+            ])
+
+    def action_walk(self, step):
+        """ Moves of the parallel semantics.
+
+            The moves of a step form a walk of the player from its square
+            over squares that were empty. A move continues the walk from
+            where the previous one ended and the player stays where the walk
+            ends, unless it pushes a box from there.
+        """
+        self.theory.writeComment('Action move(fromXY, toXY, step) - chodza hraca v ramci kroku')
+        pushes_by = {XY: [] for XY in self.coords}
+        for box_id in range(self.box_count):
+            for playerXY, fromXY, toXY in self.active_pushes[box_id]:
+                pushes_by[playerXY].append(self.push(box_id+1, playerXY, fromXY, toXY, step))
+                pushes_by[playerXY].append(self.push_t(box_id+1, playerXY, fromXY, toXY, step))
+        for fromXY, toXY in self.active_moves:
+            # P+
+            self.theory.writeClause([self.neg(self.move(fromXY, toXY, step))] + self.walk_to(fromXY, step))
+            self.theory.writeClause([
+                self.neg(self.move(fromXY, toXY, step)),
+                self.empty(toXY, step-1)
+            ])
+            # E+
+            self.theory.writeClause(
+                [self.neg(self.move(fromXY, toXY, step)), self.player(toXY, step)]
+                + self.walk_from(toXY, step) + pushes_by[toXY])
+            # E-
+            self.theory.writeClause([
+                self.neg(self.move(fromXY, toXY, step)),
+                self.neg(self.player(fromXY, step))
+            ])
+        self.theory.writeComment('Frame - hrac sa objavi na policku len na konci chodze alebo pri push')
+        for XY in self.coords:
+            clause = [self.neg(self.player(XY, step))] + self.walk_to(XY, step)
+            for box_id in range(self.box_count):
+                for playerXY, fromXY, toXY in self.active_pushes_from[box_id].get(XY, []):
+                    clause.append(self.push(box_id+1, playerXY, fromXY, toXY, step))
+                    clause.append(self.push_t(box_id+1, playerXY, fromXY, toXY, step))
+            self.theory.writeClause(clause)
+            self.theory.writeClause(
+                [self.neg(self.player(XY, step-1)), self.player(XY, step)]
+                + self.walk_from(XY, step) + pushes_by[XY])
+
+    def action_reach(self, step):
+        """ Walks of the push semantics.
+
+            reach(XY, step) holds if the player can walk to XY before the
+            push of the step: XY is the player's square, or it was empty and
+            a neighbor is reached. Areas enclosed by boxes can support
+            themselves, format_plan rules such walks out with cuts. A step
+            without a push leaves the player where it was.
+        """
+        self.theory.writeComment('reach(XY, step) - hrac dojde na policko pred push')
+        for XY in self.coords:
+            self.theory.writeClause(
+                [self.neg(self.reach(XY, step)), self.player(XY, step-1)]
+                + [self.reach(neighbor, step) for neighbor in self.neighbors[XY] if neighbor is not None])
+            self.theory.writeClause([
+                self.neg(self.reach(XY, step)),
+                self.empty(XY, step-1),
+                self.player(XY, step-1)
+            ])
+        self.theory.writeComment('Frame - hrac sa objavi na policku len pri push')
+        self.theory.writeClause([self.player(XY, step) for XY in self.coords])
+        for XY in self.coords:
+            clause = [self.neg(self.player(XY, step)), self.player(XY, step-1)]
+            for box_id in range(self.box_count):
+                for playerXY, fromXY, toXY in self.active_pushes_from[box_id].get(XY, []):
+                    clause.append(self.push(box_id+1, playerXY, fromXY, toXY, step))
+                    clause.append(self.push_t(box_id+1, playerXY, fromXY, toXY, step))
+            self.theory.writeClause(clause)
+
+    def walk_exclusivity(self, step):
+        self.theory.writeComment('Hrac vstupi na policko a opusti ho najviac raz')
+        for XY in self.coords:
+            self.at_most_one(self.walk_from(XY, step))
+            self.at_most_one([self.move(fromXY, toXY, step) for fromXY, toXY in self.active_moves_to[XY]])
+        self.theory.writeComment('Push je az na konci chodze')
+        for box_id in range(self.box_count):
+            for playerXY, fromXY, toXY in self.active_pushes[box_id]:
+                for move in self.walk_from(playerXY, step):
+                    self.theory.writeClause([self.neg(self.push(box_id+1, playerXY, fromXY, toXY, step)), self.neg(move)])
+                    self.theory.writeClause([self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step)), self.neg(move)])
+
+    def walk_to(self, XY, step):
+        """ Returns literals of which one holds if the player can stand on *XY* within *step*. """
+        if self.semantics == 'push':
+            return [self.reach(XY, step)]
+        literals = [self.player(XY, step-1)]
+        if self.semantics == 'parallel':
+            literals += [self.move(fromXY, toXY, step) for fromXY, toXY in self.active_moves_to[XY]]
+        return literals
+
+    def walk_from(self, XY, step):
+        """ Returns the moves leaving *XY* within *step*, none in the sequential semantics. """
+        if self.semantics != 'parallel':
+            return []
+        return [self.move(fromXY, toXY, step) for fromXY, toXY in self.active_moves_from[XY]]
+
+    def vacated(self, XY, step):
+        """ Returns literals of which one holds if the player left *XY* before pushing within *step*. """
+        if self.semantics == 'push':
+            return [self.player(XY, step-1)]
+        return self.walk_from(XY, step)
+
+    def action_push(self, step):
+        self.theory.writeComment('Action push(box, playerXY, fromXY, toXY, step)')
+        for box_id in range(self.box_count):
+            for playerXY, fromXY, toXY in self.active_pushes[box_id]:
+                # P+
+                self.theory.writeClause([
+                    self.neg(self.push(box_id+1, playerXY, fromXY, toXY, step)),
+                    self.empty(toXY, step-1)
+                ] + self.vacated(toXY, step))
+                self.theory.writeClause([
+                    self.neg(self.push(box_id+1, playerXY, fromXY, toXY, step))
+                ] + self.walk_to(playerXY, step))
+                self.theory.writeClause([
+                    self.neg(self.push(box_id+1, playerXY, fromXY, toXY, step)),
+                    self.at(box_id+1, fromXY, step-1)
+                ])
+                # P-
+                self.theory.writeClause([
+                    self.neg(self.push(box_id+1, playerXY, fromXY, toXY, step)),
+                    self.neg(self.target(toXY))
+                ])
+                # E+
+                self.theory.writeClause([
+                    self.neg(self.push(box_id+1, playerXY, fromXY, toXY, step)),
+                    self.player(fromXY, step)
+                ])
+                self.theory.writeClause([
+                    self.neg(self.push(box_id+1, playerXY, fromXY, toXY, step)),
+                    self.at(box_id+1, toXY, step)
+                ])
+                self.theory.writeClause([
+                    self.neg(self.push(box_id+1, playerXY, fromXY, toXY, step)),
+                    self.empty(playerXY, step)
+                ])
+                if self.labeled:
                     self.theory.writeClause([
-                        self.neg(self.move(fromXY, toXY, step)),
-                        self.player(fromXY, step-1)
+                        self.neg(self.push(box_id+1, playerXY, fromXY, toXY, step)),
+                        self.neg(self.in_target(box_id+1, step))
                     ])
+                            
+
+    def action_push_t(self, step):
+        self.theory.writeComment('Action push_t(box, playerXY, fromXY, toXY, step)')
+        for box_id in range(self.box_count):
+            for playerXY, fromXY, toXY in self.active_pushes[box_id]:
+                # P+
+                self.theory.writeClause([
+                    self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step)),
+                    self.empty(toXY, step-1)
+                ] + self.vacated(toXY, step))
+                self.theory.writeClause([
+                    self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step))
+                ] + self.walk_to(playerXY, step))
+                self.theory.writeClause([
+                    self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step)),
+                    self.at(box_id+1, fromXY, step-1)
+                ])
+                self.theory.writeClause([
+                    self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step)),
+                    self.target(toXY)
+                ])
+                # P-
+                self.theory.writeClause([
+                    self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step)),
+                    self.neg(self.in_target(box_id+1, step-1)) if self.labeled else self.neg(self.target(fromXY))
+                ])
+                # E+
+                self.theory.writeClause([
+                    self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step)),
+                    self.player(fromXY, step)
+                ])
+                self.theory.writeClause([
+                    self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step)),
+                    self.at(box_id+1, toXY, step)
+                ])
+                self.theory.writeClause([
+                    self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step)),
+                    self.empty(playerXY, step)
+                ])
+                if self.labeled:
+                    self.theory.writeClause([
+                        self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step)),
+                        self.in_target(box_id+1, step)
+                    ])
+
+    def frame_problem(self, step):
+        if self.frame == 'explanatory':
+            self.explanatory_frame(step)
+            return
+        self.theory.writeComment('Frame 1 - ak sa hrac posunie, nezmeni sa poloha boxov')
+        self.theory.writeComment('Frame 2 - ak sa hrac posunie, boxy ktore boli/neboli v cieli zostanu/nebudu v cieli')
+        for box_id in range(len(self.level.boxes)):
+            for boxXY in self.box_cells:
+                for fromXY, toXY in self.active_moves:
                     self.theory.writeClause([
+                        self.neg(self.at(box_id+1, boxXY, step-1)),
                         self.neg(self.move(fromXY, toXY, step)),
-                        self.empty(toXY, step-1)
+                        self.at(box_id+1, boxXY, step)
                     ])
-                    # E+
                     self.theory.writeClause([
+                        self.neg(self.in_target(box_id+1, step-1)),
                         self.neg(self.move(fromXY, toXY, step)),
-                        self.player(toXY, step)
+                        self.in_target(box_id+1, step),
                     ])
                     self.theory.writeClause([
+                        self.in_target(box_id+1, step-1),
                         self.neg(self.move(fromXY, toXY, step)),
-                        self.empty(fromXY, step)
+                        self.neg(self.in_target(box_id+1, step)),
                     ])
-
-    def action_push(self, step):
-        self.theory.writeComment('Action push(box, playerXY, fromXY, toXY, step)')
-        for box_id in range(len(self.map_data['boxes'])):
-            for playerXY in self.coords:
-                for fromXY in self.coords:
-                    for toXY in self.coords:
-                        if self.is_inline(playerXY, fromXY, toXY):
-                            # P+
-                            self.theory.writeClause([
-                                self.neg(self.push(box_id+1, playerXY, fromXY, toXY, step)),
-                                self.empty(toXY, step-1)
-                            ])
-                            self.theory.writeClause([
-                                self.neg(self.push(box_id+1, playerXY, fromXY, toXY, step)),
-                                self.player(playerXY, step-1)
-                            ])
-                            self.theory.writeClause([
-                                self.neg(self.push(box_id+1, playerXY, fromXY, toXY, step)),
-                                self.at(box_id+1, fromXY, step-1)
-                            ])
-                            # P-
-                            self.theory.writeClause([
-                                self.neg(self.push(box_id+1, playerXY, fromXY, toXY, step)),
-                                self.neg(self.target(toXY))
-                            ])
-                            # E+
-                            self.theory.writeClause([
-                                self.neg(self.push(box_id+1, playerXY, fromXY, toXY, step)),
-                                self.player(fromXY, step)
-                            ])
-                            self.theory.writeClause([
-                                self.neg(self.push(box_id+1, playerXY, fromXY, toXY, step)),
-                                self.at(box_id+1, toXY, step)
-                            ])
-                            self.theory.writeClause([
-                                self.neg(self.push(box_id+1, playerXY, fromXY, toXY, step)),
-                                self.empty(playerXY, step)
-                            ])
-                            self.theory.writeClause([
-                                self.neg(self.push(box_id+1, playerXY, fromXY, toXY, step)),
-                                self.neg(self.in_target(box_id+1, step))
-                            ])
-                            
-
-    def action_push_t(self, step):
-        self.theory.writeComment('Action push_t(box, playerXY, fromXY, toXY, step)')
-        for box_id in range(len(self.map_data['boxes'])):
-            for playerXY in self.coords:
-                for fromXY in self.coords:
-                    for toXY in self.coords:
-                        if self.is_inline(playerXY, fromXY, toXY):
-                            # P+
-                            self.theory.writeClause([
-                                self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step)),
-                                self.empty(toXY, step-1)
-                            ])
-                            self.theory.writeClause([
-                                self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step)),
-                                self.player(playerXY, step-1)
-                            ])
-                            self.theory.writeClause([
-                                self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step)),
-                                self.at(box_id+1, fromXY, step-1)
-                            ])
-                            self.theory.writeClause([
-                                self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step)),
-                                self.target(toXY)
-                            ])
-                            # P-
-                            self.theory.writeClause([
-                                self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step)),
-                                self.neg(self.in_target(box_id+1, step-1))
-                            ])
-                            # E+
-                            self.theory.writeClause([
-                                self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step)),
-                                self.player(fromXY, step)
-                            ])
+        self.theory.writeComment('Frame 3 - ak sa posunie nejaky box, ostatne boxy sa neposunu')
+        self.theory.writeComment('Frame 4 - ak sa posunie nejaky box, a ak nejaky iny je/nieje v cieli tak zostane/nebude v cieli')
+        for box_id in range(len(self.level.boxes)):
+            for boxXY in self.box_cells:
+                for box_id2 in range(len(self.level.boxes)):
+                    if box_id != box_id2:
+                        for playerXY, fromXY, toXY in self.active_pushes[box_id2]:
                             self.theory.writeClause([
-                                self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step)),
-                                self.at(box_id+1, toXY, step)
+                                self.neg(self.at(box_id+1, boxXY, step-1)),
+                                self.neg(self.push(box_id2+1, playerXY, fromXY, toXY, step)),
+                                self.at(box_id+1, boxXY, step)
                             ])
                             self.theory.writeClause([
-                                self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step)),
-                                self.empty(playerXY, step)
+                                self.neg(self.at(box_id+1, boxXY, step-1)),
+                                self.neg(self.push_t(box_id2+1, playerXY, fromXY, toXY, step)),
+                                self.at(box_id+1, boxXY, step)
                             ])
                             self.theory.writeClause([
-                                self.neg(self.push_t(box_id+1, playerXY, fromXY, toXY, step)),
+                                self.neg(self.in_target(box_id+1, step-1)),
+                                self.neg(self.push(box_id2+1, playerXY, fromXY, toXY, step)),
                                 self.in_target(box_id+1, step)
                             ])
-
-    def frame_problem(self, step):
-        self.theory.writeComment('Frame 1 - ak sa hrac posunie, nezmeni sa poloha boxov')
-        self.theory.writeComment('Frame 2 - ak sa hrac posunie, boxy ktore boli/neboli v cieli zostanu/nebudu v cieli')
-        for box_id in range(len(self.map_data['boxes'])):
-            for boxXY in self.coords:
-                for fromXY in self.coords:
-                    for toXY in self.coords:
-                        if self.is_adjacent(fromXY, toXY):
                             self.theory.writeClause([
-                                self.neg(self.at(box_id+1, boxXY, step-1)),
-                                self.neg(self.move(fromXY, toXY, step)),
-                                self.at(box_id+1, boxXY, step)
+                                self.neg(self.in_target(box_id+1, step-1)),
+                                self.neg(self.push_t(box_id2+1, playerXY, fromXY, toXY, step)),
+                                self.in_target(box_id+1, step)
                             ])
                             self.theory.writeClause([
-                                self.neg(self.in_target(box_id+1, step-1)),
-                                self.neg(self.move(fromXY, toXY, step)),
-                                self.in_target(box_id+1, step),
+                                self.in_target(box_id+1, step-1),
+                                self.neg(self.push(box_id2+1, playerXY, fromXY, toXY, step)),
+                                self.neg(self.in_target(box_id+1, step))
                             ])
                             self.theory.writeClause([
                                 self.in_target(box_id+1, step-1),
-                                self.neg(self.move(fromXY, toXY, step)),
-                                self.neg(self.in_target(box_id+1, step)),
+                                self.neg(self.push_t(box_id2+1, playerXY, fromXY, toXY, step)),
+                                self.neg(self.in_target(box_id+1, step))
                             ])
-        self.theory.writeComment('Frame 3 - ak sa posunie nejaky box, ostatne boxy sa neposunu')
-        self.theory.writeComment('Frame 4 - ak sa posunie nejaky box, a ak nejaky iny je/nieje v cieli tak zostane/nebude v cieli')
-        for box_id in range(len(self.map_data['boxes'])):
-            for boxXY in self.coords:
-                for box_id2 in range(len(self.map_data['boxes'])):
-                    if box_id != box_id2:
-                        for playerXY in self.coords:
-                            for fromXY in self.coords:
-                                for toXY in self.coords:
-                                    if self.is_inline(playerXY, fromXY, toXY):
-                                        self.theory.writeClause([
-                                            self.neg(self.at(box_id+1, boxXY, step-1)),
-                                            self.neg(self.push(box_id2+1, playerXY, fromXY, toXY, step)),
-                                            self.at(box_id+1, boxXY, step)
-                                        ])
-                                        self.theory.writeClause([
-                                            self.neg(self.at(box_id+1, boxXY, step-1)),
-                                            self.neg(self.push_t(box_id2+1, playerXY, fromXY, toXY, step)),
-                                            self.at(box_id+1, boxXY, step)
-                                        ])
-                                        self.theory.writeClause([
-                                            self.neg(self.in_target(box_id+1, step-1)),
-                                            self.neg(self.push(box_id2+1, playerXY, fromXY, toXY, step)),
-                                            self.in_target(box_id+1, step)
-                                        ])
-                                        self.theory.writeClause([
-                                            self.neg(self.in_target(box_id+1, step-1)),
-                                            self.neg(self.push_t(box_id2+1, playerXY, fromXY, toXY, step)),
-                                            self.in_target(box_id+1, step)
-                                        ])
-                                        self.theory.writeClause([
-                                            self.in_target(box_id+1, step-1),
-                                            self.neg(self.push(box_id2+1, playerXY, fromXY, toXY, step)),
-                                            self.neg(self.in_target(box_id+1, step))
-                                        ])
-                                        self.theory.writeClause([
-                                            self.in_target(box_id+1, step-1),
-                                            self.neg(self.push_t(box_id2+1, playerXY, fromXY, toXY, step)),
-                                            self.neg(self.in_target(box_id+1, step))
-                                        ])
 
+    def explanatory_frame(self, step):
+        self.theory.writeComment('Frame - box opusti policko len ak ho niekto z neho potlaci')
+        boxes = self.box_squares(step-1)
+        for box_id in range(self.box_count):
+            for XY in self.box_cells:
+                if XY not in boxes[box_id]:
+                    continue
+                clause = [self.neg(self.at(box_id+1, XY, step-1)), self.at(box_id+1, XY, step)]
+                for playerXY, fromXY, toXY in self.active_pushes_from[box_id][XY]:
+                    clause.append(self.push(box_id+1, playerXY, fromXY, toXY, step))
+                    clause.append(self.push_t(box_id+1, playerXY, fromXY, toXY, step))
+                self.theory.writeClause(clause)
+        if not self.labeled:
+            self.theory.writeComment('Frame - box sa objavi na policku len ak ho niekto nan potlaci')
+            boxes = self.box_squares(step)
+            for XY in self.box_cells:
+                if XY not in boxes[0]:
+                    continue
+                clause = [self.at(1, XY, step-1), self.neg(self.at(1, XY, step))]
+                for playerXY, fromXY, toXY in self.active_pushes_to[XY]:
+                    clause.append(self.push(1, playerXY, fromXY, toXY, step))
+                    clause.append(self.push_t(1, playerXY, fromXY, toXY, step))
+                self.theory.writeClause(clause)
+            return
+        self.theory.writeComment('Frame - box opusti ciel len pri push, do ciela sa dostane len pri push_t')
+        for box_id in range(self.box_count):
+            clause = [self.neg(self.in_target(box_id+1, step-1)), self.in_target(box_id+1, step)]
+            for playerXY, fromXY, toXY in self.active_pushes[box_id]:
+                clause.append(self.push(box_id+1, playerXY, fromXY, toXY, step))
+            self.theory.writeClause(clause)
+            clause = [self.in_target(box_id+1, step-1), self.neg(self.in_target(box_id+1, step))]
+            for playerXY, fromXY, toXY in self.active_pushes[box_id]:
+                clause.append(self.push_t(box_id+1, playerXY, fromXY, toXY, step))
+            self.theory.writeClause(clause)
 
     def encode_goal(self, step):
         self.theory.writeComment('Goal')
-        for box_id in range(len(self.map_data['boxes'])):
-            self.theory.writeClause([self.in_target(box_id+1, step)])
+        self.theory.writeClauses([literal] for literal in self.goal_literals(step))
+
+    def goal_literals(self, step):
+        """ Returns the literals that have to hold after *step* steps.
+
+            In the incremental encoding these are the only clauses that
+            change between horizons, so a solver that supports assumptions
+            can take them instead of the unit clauses.
+        """
+        if not self.labeled:
+            return [self.neg(self.at(1, XY, step)) for XY in self.box_cells if not self.level.is_target(XY)]
+        return [self.in_target(box_id+1, step) for box_id in range(self.box_count)]
 
     def encode_init_state(self):
         self.theory.writeComment('Initial state loaded from the map')
         self.theory.writeComment('Targets on the map (fact)')
         for XY in self.coords:
-            if XY in self.map_data['targets']:
+            if self.level.is_target(XY):
                 self.theory.writeClause([self.target(XY)])    
             else:
                 self.theory.writeClause([self.neg(self.target(XY))])
         self.theory.writeComment('Initial position of the player loaded from the map')
         for XY in self.coords:
-            if XY == self.map_data['sokoban']:
+            if XY == self.level.player:
                 self.theory.writeClause([self.player(XY, 0)])
             else:
                 self.theory.writeClause([self.neg(self.player(XY, 0))])
         self.theory.writeComment('Initial boxes position loaded from the map')
-        for XY in self.coords:
-            for index, box in enumerate(self.map_data['boxes']):
+        if not self.labeled:
+            for XY in self.box_cells:
+                if self.level.is_box(XY):
+                    self.theory.writeClause([self.at(1, XY, 0)])
+                else:
+                    self.theory.writeClause([self.neg(self.at(1, XY, 0))])
+        for XY in self.box_cells if self.labeled else []:
+            for index, box in enumerate(self.level.boxes):
                 if XY == box:
                     self.theory.writeClause([self.at(index+1, XY, 0)])
                 else:
                     self.theory.writeClause([self.neg(self.at(index+1, XY, 0))])
         self.theory.writeComment('Boxes in the target')
-        for index, box in enumerate(self.map_data['boxes']):
-            if box in self.map_data['targets']:
+        for index, box in enumerate(self.level.boxes if self.labeled else []):
+            if self.level.is_target(box):
                 self.theory.writeClause([self.in_target(index+1, 0)])
             else:
                 self.theory.writeClause([self.neg(self.in_target(index+1, 0))])
         self.theory.writeComment('Initial empty squares loaded from the map')
         for XY in self.coords:
-            if XY not in self.map_data['boxes'] and XY != self.map_data['sokoban']:
+            if not self.level.is_box(XY) and XY != self.level.player:
                 self.theory.writeClause([self.empty(XY, 0)])
             else:
                 self.theory.writeClause([self.neg(self.empty(XY, 0))])
 
+    def build_level_index(self):
+        """ Indexes the floor of the map.
+
+            Builds cell ids, a table of neighbors in every direction (None
+            for walls) and the lists of valid moves (fromXY, toXY) and pushes
+            (playerXY, fromXY, toXY), which the encoders iterate over. With
+            prune_dead, squares from which no box can reach a target are left
+            out of box_cells and pushes into them are dropped.
+        """
+        self.cell_ids = {XY: i for i, XY in enumerate(self.coords)}
+        self.neighbors = {}
+        for XY in self.coords:
+            self.neighbors[XY] = []
+            for dx, dy in self.DIRECTIONS:
+                neighbor = (XY[0]+dx, XY[1]+dy)
+                self.neighbors[XY].append(neighbor if neighbor in self.cell_ids else None)
+        self.moves = []
+        self.pushes = []
+        for playerXY in self.coords:
+            for direction, fromXY in enumerate(self.neighbors[playerXY]):
+                if fromXY is None:
+                    continue
+                self.moves.append((playerXY, fromXY))
+                toXY = self.neighbors[fromXY][direction]
+                if toXY is not None:
+                    self.pushes.append((playerXY, fromXY, toXY))
+        self.moves.sort()
+        self.pushes.sort()
+        self.push_count = len(self.pushes)
+        self.dead_squares = set()
+        if self.prune_dead:
+            self.dead_squares = set(self.coords) - self.find_live_squares()
+        self.box_cells = [XY for XY in self.coords
+                          if XY not in self.dead_squares or self.level.is_box(XY)]
+        self.box_cell_ids = {XY: i for i, XY in enumerate(self.box_cells)}
+        self.pushes = [push for push in self.pushes
+                       if push[1] in self.box_cell_ids and push[2] not in self.dead_squares]
+        self.pushes_from = {XY: [] for XY in self.box_cells}
+        self.pushes_to = {XY: [] for XY in self.box_cells}
+        for push in self.pushes:
+            self.pushes_from[push[1]].append(push)
+            self.pushes_to[push[2]].append(push)
+
+    def find_live_squares(self):
+        """ Returns the squares from which a box can still be pushed to some target.
+
+            Works backwards from the targets: a box can reach a live square
+            from the square behind it if the player fits behind that one.
+        """
+        pushes_to = {XY: [] for XY in self.coords}
+        for playerXY, fromXY, toXY in self.pushes:
+            pushes_to[toXY].append(fromXY)
+        live = set(XY for XY in self.level.targets if XY in self.cell_ids)
+        queue = list(live)
+        while queue:
+            XY = queue.pop()
+            for fromXY in pushes_to[XY]:
+                if fromXY not in live:
+                    live.add(fromXY)
+                    queue.append(fromXY)
+        return live
+
+    def build_variable_layout(self):
+        """ Builds the index tables used to number variables in the dimacs encoding.
+
+            Variables of the targets come first, followed by one block per
+            step holding the fluents of that step, the actions leading to
+            the next one and the auxiliary variables of the cardinality
+            constraints of the next step. The actions start with the moves,
+            or the reach variables in the push semantics.
+        """
+        self.box_count = len(self.level.boxes) if self.labeled else 1
+        self.move_ids = {move: i for i, move in enumerate(self.moves)}
+        self.push_ids = {push: i for i, push in enumerate(self.pushes)}
+        cells = len(self.coords)
+        box_cells = len(self.box_cells)
+        self.fluent_size = 2 * cells + self.box_count * box_cells + (self.box_count if self.labeled else 0)
+        self.walk_size = cells if self.semantics == 'push' else len(self.moves)
+        self.action_size = self.walk_size + 2 * self.box_count * len(self.pushes)
+        self.aux_size = (lib.cardinality.aux_count(cells, self.cardinality)
+                         + self.box_count * lib.cardinality.aux_count(box_cells, self.cardinality))
+        if self.semantics != 'sequential':
+            self.aux_size += lib.cardinality.aux_count(2 * self.box_count * len(self.pushes), self.cardinality)
+        if self.semantics == 'parallel':
+            for XY in self.coords:
+                degree = len(self.DIRECTIONS) - self.neighbors[XY].count(None)
+                self.aux_size += 2 * lib.cardinality.aux_count(degree, self.cardinality)
+        if self.semantics == 'sequential':
+            self.aux_size += lib.cardinality.aux_count(self.action_size, self.cardinality)
+        self.step_size = self.fluent_size + self.action_size + self.aux_size
+
+    def variable_count(self, iteration):
+        return len(self.coords) + iteration * self.step_size + self.fluent_size
+
+    def fluent_base(self, step):
+        return len(self.coords) + 1 + step * self.step_size
+
+    def action_base(self, step):
+        return self.fluent_base(step - 1) + self.fluent_size
+
+    def aux_base(self, step):
+        return self.action_base(step) + self.action_size
+
     def push(self, box_id, playerXY, fromXY, toXY, step):
-        return ('push(box{},{}_{},{}_{},{}_{},{})'
-                .format(box_id, playerXY[0], playerXY[1], fromXY[0], fromXY[1], toXY[0], toXY[1], step))
+        if self.encoding == 'dimacs':
+            return (self.action_base(step) + self.walk_size + (box_id-1) * len(self.pushes)
+                    + self.push_ids[(playerXY, fromXY, toXY)])
+        return self.push_name(box_id, playerXY, fromXY, toXY, step)
 
     def push_t(self, box_id, playerXY, fromXY, toXY, step):
-        return ('push_t(box{},{}_{},{}_{},{}_{},{})'
-                .format(box_id, playerXY[0], playerXY[1], fromXY[0], fromXY[1], toXY[0], toXY[1], step))
+        if self.encoding == 'dimacs':
+            return (self.action_base(step) + self.walk_size + (self.box_count+box_id-1) * len(self.pushes)
+                    + self.push_ids[(playerXY, fromXY, toXY)])
+        return self.push_t_name(box_id, playerXY, fromXY, toXY, step)
 
     def move(self, fromXY, toXY, step):
-        return 'move({}_{},{}_{},{})'.format(fromXY[0], fromXY[1], toXY[0], toXY[1], step)
+        if self.encoding == 'dimacs':
+            return self.action_base(step) + self.move_ids[(fromXY, toXY)]
+        return self.move_name(fromXY, toXY, step)
+
+    def reach(self, XY, step):
+        if self.encoding == 'dimacs':
+            return self.action_base(step) + self.cell_ids[XY]
+        return 'reach({}_{},{})'.format(XY[0], XY[1], step)
 
     def empty(self, XY, step):
+        if self.encoding == 'dimacs':
+            return self.fluent_base(step) + len(self.coords) + self.cell_ids[XY]
         return 'empty({}_{},{})'.format(XY[0], XY[1], step)
 
     def player(self, XY, step):
+        if self.encoding == 'dimacs':
+            return self.fluent_base(step) + self.cell_ids[XY]
         return 'player({}_{},{})'.format(XY[0], XY[1], step)
 
     def at(self, box_id, XY, step):
+        if self.encoding == 'dimacs':
+            return (self.fluent_base(step) + 2 * len(self.coords) + (box_id-1) * len(self.box_cells)
+                    + self.box_cell_ids[XY])
         return 'at(box{},{}_{},{})'.format(box_id, XY[0], XY[1], step)
 
     def target(self, XY):
+        if self.encoding == 'dimacs':
+            return 1 + self.cell_ids[XY]
         return 'target({}_{})'.format(XY[0], XY[1])
 
     def in_target(self, box_id, step):
+        if self.encoding == 'dimacs':
+            return (self.fluent_base(step) + 2 * len(self.coords) + self.box_count * len(self.box_cells)
+                    + box_id - 1)
         return 'in_target(box{},{})'.format(box_id, step)
 
     def neg(self, predicate):
+        if self.encoding == 'dimacs':
+            return -predicate
         return '-' + predicate
 
-    def load_map(self, file_name):
-        self.map_data = {
-            'map_size': (),
-            'walls': [],
-            'sokoban': (),
-            'boxes': [],
-            'targets': []
-        }
-        with open(file_name) as f:
-            l = 0
-            for line in f:
-                ch = 0
-                for char in line:
-                    if char == '#':
-                        self.map_data['walls'].append((l, ch))
-                    elif char == 'S':
-                        self.map_data['sokoban'] = (l, ch)
-                    elif char == 'X':
-                        self.map_data['sokoban'] = (l, ch)
-                        self.map_data['targets'].append((l, ch))
-                    elif char == 'B':
-                        self.map_data['boxes'].append((l, ch))
-                    elif char == 'T':
-                        self.map_data['targets'].append((l, ch))
-                    ch += 1
-                l += 1
-            self.map_data['map_size'] = (l, ch)
-
-    def generate_coords(self):
-        coords = []
-        for x in range(self.map_data['map_size'][0]):
-            for y in range(self.map_data['map_size'][1]):
-                if (x, y) not in self.map_data['walls']:
-                    coords.append((x, y))
-        return coords
+    def push_name(self, box_id, playerXY, fromXY, toXY, step):
+        return ('push(box{},{}_{},{}_{},{}_{},{})'
+                .format(box_id, playerXY[0], playerXY[1], fromXY[0], fromXY[1], toXY[0], toXY[1], step))
+
+    def push_t_name(self, box_id, playerXY, fromXY, toXY, step):
+        return ('push_t(box{},{}_{},{}_{},{}_{},{})'
+                .format(box_id, playerXY[0], playerXY[1], fromXY[0], fromXY[1], toXY[0], toXY[1], step))
+
+    def move_name(self, fromXY, toXY, step):
+        return 'move({}_{},{}_{},{})'.format(fromXY[0], fromXY[1], toXY[0], toXY[1], step)
+
+    def parse_action(self, action):
+        """ Splits an action string into its name and arguments, coordinates as tuples. """
+        name, args = action.rstrip(')').split('(')
+        res = []
+        for arg in args.split(','):
+            if '_' in arg:
+                x, y = arg.split('_')
+                res.append((int(x), int(y)))
+            elif arg.startswith('box'):
+                res.append(int(arg[3:]))
+            else:
+                res.append(int(arg))
+        return (name, tuple(res))
+
+    def check_plan(self, actions):
+        """ Replays *actions* on the loaded map.
+
+            Returns True if every action is legal and all boxes end up in
+            targets.
+        """
+        player = self.level.player
+        boxes = set(self.level.boxes)
+        for action in actions:
+            name, args = self.parse_action(action)
+            if name == 'move':
+                fromXY, toXY = args[0], args[1]
+                if fromXY != player or not self.is_adjacent(fromXY, toXY):
+                    return False
+                if toXY not in self.cell_ids or toXY in boxes:
+                    return False
+                player = toXY
+            else:
+                playerXY, fromXY, toXY = args[1], args[2], args[3]
+                if playerXY != player or not self.is_inline(playerXY, fromXY, toXY):
+                    return False
+                if fromXY not in boxes or toXY not in self.cell_ids or toXY in boxes:
+                    return False
+                boxes.remove(fromXY)
+                boxes.add(toXY)
+                player = fromXY
+        return all(self.level.is_target(box) for box in boxes)
 
     def is_inline(self, playerXY, fromXY, toXY):
         if not self.is_adjacent(fromXY, toXY) or not self.is_adjacent(playerXY, fromXY) or playerXY == toXY:
@@ -456,6 +1460,32 @@ class SokobanSolver(object):
         return False 
 
 
+worker_solver = None
+worker_bound = None
+encoder_solver = None
+
+def init_worker(bound, level, options, workdir):
+    """ Creates the solver used by a HorizonScheduler worker process. """
+    global worker_solver, worker_bound
+    worker_bound = bound
+    worker_solver = SokobanSolver(level, **options)
+    worker_solver.set_workdir(tempfile.mkdtemp(dir=workdir))
+
+def init_encoder(level, options, comments):
+    """ Creates the solver used by an encoder pool worker process, writing to memory. """
+    global encoder_solver
+    encoder_solver = SokobanSolver(level, **options)
+    encoder_solver.close()
+    encoder_solver.theory = encoder_solver.new_writer(None, comments)
+
+def encode_worker(step):
+    return encoder_solver.step_block(step)
+
+def probe_worker(horizon):
+    worker_solver.cancelled = lambda: worker_bound.value < horizon
+    return worker_solver.probe(horizon)
+
+
 if __name__ == "__main__":
     ss = SokobanSolver('maps/map3.txt')
     ss.solve()
@@ -0,0 +1,328 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import signal
+import argparse
+import tempfile
+import collections
+import multiprocessing
+import multiprocessing.connection
+from SokobanSolver import SokobanSolver
+from SokobanSearch import SokobanSearch
+from lib.level import Level
+import lib.cardinality
+import lib.satsolver
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# extensions of the level files picked from a directory
+LEVEL_FILES = ('*.txt', '*.xsb', '*.sok')
+
+
+def level_files(name):
+    """ Returns the level files of a file, directory or glob. """
+    if os.path.isdir(name):
+        return sorted(path for pattern in LEVEL_FILES for path in glob.glob(os.path.join(name, pattern)))
+    if os.path.exists(name):
+        return [name]
+    return sorted(glob.glob(name))
+
+
+def collect_levels(inputs, level=None):
+    """ Yields (file, index, level) for every level of the files, directories and globs given.
+
+        With *level*, a zero based index, only that level of every file is yielded.
+    """
+    for name in inputs:
+        for file_name in level_files(name):
+            for index, found in enumerate(Level.load(file_name)):
+                if level is None or index == level:
+                    yield (file_name, index, found)
+
+
+def solve_level(conn, level, backend, options, limit, memory, workdir, measure=False):
+    """ Solves one level in a worker process and sends the result through *conn*. """
+    if hasattr(os, 'setsid'):
+        os.setsid()
+    if memory and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory * 2**20, memory * 2**20))
+    sys.stdout = open(os.devnull, 'w')
+    conn.send(solve(level, backend, options, limit, workdir, measure))
+    conn.close()
+
+
+def solve(level, backend, options, limit, workdir, measure=False):
+    """ Returns the result of solving *level* as a dict with the status, the plan and the time.
+
+        With *measure* the result also holds the totals of the profiler
+        records and the peak memory, see measurements.
+    """
+    start = time.time()
+    result = {}
+    records = []
+    solver = None
+    try:
+        if backend == 'search':
+            solver = SokobanSearch(level, **options)
+        else:
+            solver = SokobanSolver(level, **options)
+        if measure:
+            solver.profiler.add_hook(records.append)
+        solver.set_workdir(workdir)
+        solver.set_limit(limit)
+        solution_found, solution = solver.find_plan()
+        result['status'] = 'solved' if solution_found else 'limit'
+        if solution_found:
+            result['length'] = len(solution)
+            result['pushes'] = sum(1 for action in solution if action.startswith('push'))
+            result['plan'] = solution
+    except MemoryError:
+        result = {'status': 'memory'}
+    except Exception as e:
+        result = {'status': 'error', 'message': '{}: {}'.format(type(e).__name__, e)}
+    finally:
+        if solver is not None:
+            solver.close()
+    result['time'] = round(time.time() - start, 3)
+    if measure:
+        result.update(measurements(records))
+    return result
+
+
+def measurements(records):
+    """ Returns the encoding and solving time summed over the profiler *records*, the size of the
+        last theory and the peak memory in megabytes of this process and of its solvers.
+
+        The peak of the solvers is at least the memory of this process when
+        it started them, the kernel counts it before the exec.
+    """
+    phases = collections.Counter()
+    for record in records:
+        for name, phase in record['phases'].items():
+            phases[name] += phase['wall']
+    result = {
+        'horizons': len(records),
+        'encode': round(phases['encode'] + phases['translate'], 3),
+        'solve': round(phases['solve'], 3)
+    }
+    if records:
+        result['variables'] = sum(records[-1]['variables'].values())
+        result['clauses'] = sum(records[-1]['clauses'].values())
+        result['size'] = records[-1]['size']
+    if resource is not None:
+        # kilobytes on Linux, bytes on macOS
+        unit = 2**20 if sys.platform == 'darwin' else 2**10
+        result['memory'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1)
+        result['solver_memory'] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit, 1)
+    return result
+
+
+def kill(process):
+    if hasattr(os, 'killpg'):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+    else:
+        process.terminate()
+    process.join()
+
+
+def run_batch(levels, backend, options, limit, jobs, time_limit, memory, report, measure=False):
+    """ Solves *levels* on up to *jobs* worker processes, passing a result dict per level to *report*.
+
+        A worker is killed with its solver processes when it runs for more
+        than *time_limit* seconds. *memory* limits the address space of a
+        worker in megabytes where the resource module is available.
+    """
+    pending = collections.deque(levels)
+    running = {}
+    workroot = tempfile.mkdtemp(prefix='sokoban-batch-')
+    try:
+        while pending or running:
+            while pending and len(running) < jobs:
+                file_name, index, level = pending.popleft()
+                receiver, sender = multiprocessing.Pipe(duplex=False)
+                workdir = tempfile.mkdtemp(dir=workroot)
+                process = multiprocessing.Process(target=solve_level,
+                                                  args=(sender, level, backend, options, limit, memory,
+                                                        workdir, measure))
+                process.start()
+                sender.close()
+                entry = {'file': file_name, 'level': index + 1, 'name': level.name}
+                running[receiver] = (process, entry, time.time(), workdir)
+            now = time.time()
+            timeout = None
+            if time_limit:
+                timeout = max(0, min(start + time_limit for _, _, start, _ in running.values()) - now)
+            for receiver in multiprocessing.connection.wait(list(running), timeout):
+                process, entry, start, workdir = running.pop(receiver)
+                try:
+                    entry.update(receiver.recv())
+                except EOFError:
+                    process.join()
+                    entry.update({'status': 'error', 'time': round(time.time() - start, 3),
+                                  'message': 'worker exited with code {}'.format(process.exitcode)})
+                receiver.close()
+                process.join()
+                shutil.rmtree(workdir, ignore_errors=True)
+                report(entry)
+            now = time.time()
+            for receiver, (process, entry, start, workdir) in list(running.items()):
+                if time_limit and now - start >= time_limit:
+                    del running[receiver]
+                    kill(process)
+                    receiver.close()
+                    shutil.rmtree(workdir, ignore_errors=True)
+                    entry.update({'status': 'timeout', 'time': round(now - start, 3)})
+                    report(entry)
+    finally:
+        for receiver, (process, entry, start, workdir) in running.items():
+            kill(process)
+        shutil.rmtree(workroot, ignore_errors=True)
+
+
+def race(level, entries, limit, memory=0):
+    """ Solves *level* with every (backend, options) of *entries* at once, one process each.
+
+        Returns (backend, result) of the first backend that finds a plan and
+        kills the others. Without a plan, the result of the backend that
+        finished last is returned.
+    """
+    running = {}
+    workroot = tempfile.mkdtemp(prefix='sokoban-race-')
+    answer = None
+    try:
+        for backend, options in entries:
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=solve_level,
+                                              args=(sender, level, backend, options, limit, memory,
+                                                    tempfile.mkdtemp(dir=workroot)))
+            process.start()
+            sender.close()
+            running[receiver] = (process, backend)
+        while running:
+            for receiver in multiprocessing.connection.wait(list(running)):
+                process, backend = running.pop(receiver)
+                try:
+                    result = receiver.recv()
+                except EOFError:
+                    process.join()
+                    result = {'status': 'error', 'message': 'worker exited with code {}'.format(process.exitcode)}
+                receiver.close()
+                process.join()
+                answer = (backend, result)
+                if result['status'] == 'solved':
+                    return answer
+        return answer
+    finally:
+        for receiver, (process, backend) in running.items():
+            kill(process)
+            receiver.close()
+        shutil.rmtree(workroot, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Solves collections of levels on a pool of processes, '
+                                                 'writing one JSON line per level.')
+    parser.add_argument('inputs', nargs='+', help='level files, collections, directories or globs')
+    parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count(),
+                        help='number of levels solved in parallel (default: %(default)s)')
+    parser.add_argument('--time-limit', type=float, default=60,
+                        help='wall clock seconds per level, 0 for none (default: %(default)s)')
+    parser.add_argument('--memory-limit', type=int, default=0,
+                        help='megabytes of memory per level, 0 for none (default: %(default)s)')
+    parser.add_argument('--limit', type=int, default=SokobanSolver.LIMIT,
+                        help='maximal number of steps (default: %(default)s)')
+    parser.add_argument('--level', type=int,
+                        help='solve only this level of every file (default: all of them)')
+    parser.add_argument('--backend', choices=('sat', 'search'), default='sat',
+                        help='solve with MiniSat or by explicit state search (default: %(default)s)')
+    parser.add_argument('--algorithm', choices=SokobanSearch.ALGORITHMS, default='astar',
+                        help='algorithm of the search backend (default: %(default)s)')
+    parser.add_argument('--metric', choices=SokobanSearch.METRICS, default='moves',
+                        help='cost minimized by the search backend (default: %(default)s)')
+    parser.add_argument('--semantics', choices=SokobanSolver.SEMANTICS, default='sequential',
+                        help='steps of the SAT backend (default: %(default)s)')
+    parser.add_argument('--boxes', choices=SokobanSolver.BOXES, default='labeled',
+                        help='box encoding of the SAT backend (default: %(default)s)')
+    parser.add_argument('--encoding', choices=SokobanSolver.ENCODINGS, default='dimacs',
+                        help='theory written by the SAT backend (default: %(default)s)')
+    parser.add_argument('--cardinality', choices=lib.cardinality.ENCODINGS, default='sequential',
+                        help='encoding of the at-most-one constraints (default: %(default)s)')
+    parser.add_argument('--frame', choices=SokobanSolver.FRAMES, default='explanatory',
+                        help='frame axioms of the SAT backend (default: %(default)s)')
+    parser.add_argument('--solver', dest='solvers', action='append',
+                        help='SAT solver of the SAT backend, several make a portfolio (default: minisat)')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='append a JSON line per horizon solved by the SAT backend to FILE')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='cache directory shared by the jobs')
+    parser.add_argument('--no-prune-dead', dest='prune_dead', action='store_false',
+                        help='keep box variables and pushes for squares no box can leave towards a target')
+    parser.add_argument('--no-reachability', dest='reachability', action='store_false',
+                        help='do not fix positions and actions that are unreachable at a step')
+    parser.add_argument('--no-lower-bound', dest='lower_bound', action='store_false',
+                        help='start at one step instead of a lower bound on the plan length')
+    parser.add_argument('--no-incremental', dest='incremental', action='store_false',
+                        help='encode every horizon from scratch instead of extending the previous one')
+    parser.add_argument('--no-plans', dest='plans', action='store_false',
+                        help='leave the plans out of the results')
+    parser.add_argument('--output', help='file the results are appended to instead of the standard output')
+    args = parser.parse_args()
+
+    if args.jobs < 1:
+        parser.error('number of jobs must be greater than zero')
+    if args.level is not None and args.level < 1:
+        parser.error('level number must be greater than zero')
+    if args.backend == 'sat' and args.semantics != 'sequential' and args.frame == 'classic':
+        parser.error('--semantics {} needs the explanatory frame axioms'.format(args.semantics))
+    if args.backend == 'sat' and args.boxes == 'unlabeled' and args.frame == 'classic':
+        parser.error('--boxes unlabeled needs the explanatory frame axioms')
+    for name in args.inputs:
+        if not level_files(name):
+            parser.error('no level files found for {}'.format(name))
+    for spec in args.solvers or []:
+        try:
+            lib.satsolver.backend(spec)
+        except ValueError:
+            parser.error('unknown SAT solver: {}'.format(spec))
+    if args.backend == 'search':
+        options = {'algorithm': args.algorithm, 'metric': args.metric, 'prune_dead': args.prune_dead,
+                   'cache': args.cache}
+    else:
+        options = {'encoding': args.encoding, 'cardinality': args.cardinality, 'frame': args.frame,
+                   'semantics': args.semantics, 'boxes': args.boxes, 'prune_dead': args.prune_dead,
+                   'reachability': args.reachability, 'lower_bound': args.lower_bound,
+                   'incremental': args.incremental, 'solvers': args.solvers or ['minisat'],
+                   'profile': args.profile, 'cache': args.cache}
+
+    out = open(args.output, 'a') if args.output else sys.stdout
+    counts = collections.Counter()
+
+    def report(entry):
+        if not args.plans:
+            entry.pop('plan', None)
+        counts[entry['status']] += 1
+        out.write(json.dumps(entry, sort_keys=True) + '\n')
+        out.flush()
+
+    try:
+        levels = collect_levels(args.inputs, None if args.level is None else args.level - 1)
+        run_batch(levels, args.backend, options, args.limit, args.jobs,
+                  args.time_limit, args.memory_limit, report)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    sys.stderr.write('{} levels: {}\n'.format(sum(counts.values()),
+                                             ', '.join('{} {}'.format(n, status) for status, n in sorted(counts.items()))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import os
+import sys
+import glob
+import json
+import argparse
+from lib.level import Level
+from lib.generator import generate
+from batch import run_batch
+
+# generated levels: width, height, boxes and pulls, the plans grow with them
+GENERATED = {
+    'quick': [(6, 6, 1, 4), (7, 7, 2, 6), (8, 8, 2, 8), (9, 9, 3, 10)],
+    'full': [(6, 6, 1, 4), (7, 7, 2, 6), (8, 8, 2, 8), (9, 9, 3, 10), (10, 10, 3, 12),
+             (11, 11, 4, 14), (12, 12, 4, 16)],
+}
+
+# solver options benchmarked, on top of the defaults
+VARIANTS = {
+    'default': {},
+    'parallel': {'semantics': 'parallel'},
+    'push': {'semantics': 'push'},
+    'unlabeled': {'boxes': 'unlabeled'},
+    'text': {'encoding': 'text'},
+}
+
+# measurements that must not grow at all, they do not depend on the machine
+EXACT = ('horizons', 'length', 'variables', 'clauses', 'size')
+# measurements compared with a tolerance, and the slack added to it
+TIMED = {'encode': 0.1, 'solve': 0.1, 'time': 0.1, 'memory': 5, 'solver_memory': 5}
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark-baseline.json')
+
+
+def suite_levels(suite):
+    """ Yields (file, index, level) for the maps and the generated levels of *suite*. """
+    for file_name in sorted(glob.glob('maps/*.txt')):
+        for index, level in enumerate(Level.load(file_name)):
+            yield (file_name, index, level)
+    for index, args in enumerate(GENERATED[suite]):
+        yield ('generated', index, generate(*args))
+
+
+def regressions(result, base, tolerance):
+    """ Returns the measurements of *result* that got worse than in *base*. """
+    if result['status'] != base['status']:
+        return ['status {} -> {}'.format(base['status'], result['status'])] if base['status'] == 'solved' else []
+    worse = []
+    for name in EXACT:
+        if name in result and name in base and result[name] > base[name]:
+            worse.append('{} {} -> {}'.format(name, base[name], result[name]))
+    for name, slack in TIMED.items():
+        if name in result and name in base and result[name] > base[name] * (1 + tolerance) + slack:
+            worse.append('{} {} -> {}'.format(name, base[name], result[name]))
+    return worse
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the solver on the maps and on generated levels '
+                                                 'and compares the results with a baseline.')
+    parser.add_argument('--suite', choices=sorted(GENERATED), default='quick',
+                        help='generated levels (default: %(default)s)')
+    parser.add_argument('--variant', action='append', choices=sorted(VARIANTS),
+                        help='solver options to benchmark, can be repeated (default: default)')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of levels solved in parallel, more make the times noisy '
+                             '(default: %(default)s)')
+    parser.add_argument('--time-limit', type=float, default=120,
+                        help='wall clock seconds per level, 0 for none (default: %(default)s)')
+    parser.add_argument('--memory-limit', type=int, default=0,
+                        help='megabytes of memory per level, 0 for none (default: %(default)s)')
+    parser.add_argument('--limit', type=int, default=60,
+                        help='maximal number of steps (default: %(default)s)')
+    parser.add_argument('--baseline', default=BASELINE,
+                        help='results to compare with (default: %(default)s)')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store the results as the new baseline instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='relative growth of times and memory reported as a regression (default: %(default)s)')
+    parser.add_argument('--output', help='file the results are appended to as JSON lines')
+    args = parser.parse_args()
+
+    if args.jobs < 1:
+        parser.error('number of jobs must be greater than zero')
+    results = {}
+    for variant in args.variant or ['default']:
+        def report(entry):
+            entry['variant'] = variant
+            entry['length'] = len(entry.pop('plan', []))
+            results['{}/{}'.format(entry['name'], variant)] = entry
+            print('{:<24} {:<10} {:<8} {:>4} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8}'.format(
+                entry['name'], variant, entry['status'], entry['length'], entry.get('variables', '-'),
+                entry.get('clauses', '-'), entry.get('encode', '-'), entry.get('solve', '-'),
+                entry['time'], entry.get('memory', '-')))
+            sys.stdout.flush()
+        print('{:<24} {:<10} {:<8} {:>4} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8}'.format(
+            'level', 'variant', 'status', 'plan', 'vars', 'clauses', 'encode', 'solve', 'time', 'MB'))
+        run_batch(suite_levels(args.suite), 'sat', VARIANTS[variant], args.limit, args.jobs,
+                  args.time_limit, args.memory_limit, report, measure=True)
+
+    if args.output:
+        with open(args.output, 'a') as f:
+            for key in sorted(results):
+                f.write(json.dumps(results[key], sort_keys=True) + '\n')
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+            f.write('\n')
+        print('Baseline saved to {}'.format(args.baseline))
+        return 0
+    if not os.path.exists(args.baseline):
+        print('No baseline {}, run with --save-baseline first'.format(args.baseline))
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    failed = 0
+    for key in sorted(results):
+        if key not in baseline:
+            print('{}: not in the baseline'.format(key))
+            continue
+        worse = regressions(results[key], baseline[key], args.tolerance)
+        if worse:
+            failed += 1
+            print('{}: REGRESSION {}'.format(key, ', '.join(worse)))
+    print('{} configurations, {} regressions'.format(len(results), failed))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+import sys
+import glob
+import shutil
+import argparse
+import tempfile
+from SokobanSolver import SokobanSolver
+from lib.level import Level
+
+# options of the original encoding every variant is compared against
+REFERENCE = {'frame': 'classic', 'cardinality': 'pairwise', 'prune_dead': False, 'reachability': False}
+
+VARIANTS = {
+    'explanatory-frame': {'frame': 'explanatory'},
+    'dead-squares': {'prune_dead': True},
+    'reachability': {'reachability': True},
+    'unlabeled-boxes': {'boxes': 'unlabeled', 'frame': 'explanatory'},
+}
+
+# levels checked besides the maps, cases no map covers
+EDGE_CASES = {
+    'no-boxes': ['#####', '#S  #', '#####'],
+}
+
+
+def probe_horizons(map_name, options, horizons, workdir):
+    """ Returns {horizon: solution_found} and fails on plans that do not replay. """
+    ss = SokobanSolver(map_name, **options)
+    ss.set_workdir(tempfile.mkdtemp(dir=workdir))
+    results = {}
+    for horizon in horizons:
+        solution_found, solution = ss.probe(horizon)
+        if solution_found and not ss.check_plan(solution):
+            raise AssertionError('{}: invalid plan for horizon {}: {}'.format(map_name, horizon, solution))
+        results[horizon] = solution_found
+    ss.close()
+    return results
+
+
+def check_map(map_name, variants, limit, workdir):
+    """ Checks the map file or Level *map_name*. """
+    reference = {}
+    horizon = 0
+    while horizon < limit and not any(reference.values()):
+        horizon += 1
+        reference.update(probe_horizons(map_name, REFERENCE, [horizon], workdir))
+    ok = True
+    label = getattr(map_name, 'name', map_name)
+    for name in variants:
+        results = probe_horizons(map_name, dict(REFERENCE, **VARIANTS[name]), sorted(reference), workdir)
+        same = results == reference
+        ok = ok and same
+        print('{} {}: {} horizons {}'.format(label, name, len(reference), 'OK' if same else 'DIFFER'))
+        if not same:
+            print('  reference: {}\n  variant:   {}'.format(reference, results))
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Checks that encoding variants agree with the reference '
+                                                 'encoding on every horizon up to the shortest plan.')
+    parser.add_argument('maps', nargs='*', help='map files (default: maps/*.txt and the edge cases)')
+    parser.add_argument('--variant', action='append', choices=sorted(VARIANTS),
+                        help='variant to check, can be repeated (default: all)')
+    parser.add_argument('--limit', type=int, default=SokobanSolver.LIMIT,
+                        help='maximal horizon (default: %(default)s)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='sokoban-check-')
+    try:
+        ok = True
+        maps = args.maps or sorted(glob.glob('maps/*.txt')) + [Level(EDGE_CASES[name], name)
+                                                               for name in sorted(EDGE_CASES)]
+        for map_name in maps:
+            ok = check_map(map_name, args.variant or sorted(VARIANTS), args.limit, workdir) and ok
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,88 @@
+#
+# On-disk cache of solved horizons.
+#
+# An entry is a JSON file named by the hash of a level and the options of
+# the encoding, so equal levels share it whatever their file or title. It
+# holds the horizons proven unsatisfiable and the shortest satisfiable one
+# found with its plan. The directory is kept under a size limit by removing
+# the entries used least recently; reading an entry touches it. Entries
+# are replaced atomically, several processes can share a directory.
+#
+
+import os
+import json
+import hashlib
+import tempfile
+
+# default size limit of a cache directory in bytes
+MAX_SIZE = 64 * 2**20
+
+
+class ResultCache(object):
+
+    def __init__(self, directory, max_size=MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(level, options):
+        """ Returns the key of *level* solved with the encoding *options*, a dict. """
+        text = json.dumps({'level': level.canonical(), 'options': options}, sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        """ Returns the entry of *key* as a dict with the keys unsat and sat, or None. """
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def update(self, key, unsat=(), sat=None):
+        """ Adds horizons proven unsatisfiable to the entry of *key* and a satisfiable one.
+
+            *sat* is a dict with the horizon, the plan and whether the
+            horizon is known to be the shortest, it replaces a longer one.
+        """
+        entry = self.get(key) or {'unsat': [], 'sat': None}
+        entry['unsat'] = sorted(set(entry['unsat']) | set(unsat))
+        if sat is not None:
+            old = entry['sat']
+            if (old is None or sat['horizon'] < old['horizon']
+                    or sat['horizon'] == old['horizon'] and sat['minimal'] and not old['minimal']):
+                entry['sat'] = sat
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f, sort_keys=True)
+        os.replace(temp, self.path(key))
+        self.evict()
+
+    def evict(self):
+        """ Removes the least recently used entries until the directory fits the size limit. """
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+        entries.sort()
+        for _, size, name in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
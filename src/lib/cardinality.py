@@ -0,0 +1,117 @@
+#
+# Encodings of at-most-one and exactly-one constraints.
+#
+# All functions yield clauses as lists of literals. *new_var* is called to
+# allocate auxiliary variables and *neg* negates a literal, so the encodings
+# work both with integer literals and with named predicates.
+#
+#     pairwise    no auxiliary variables, n(n-1)/2 binary clauses
+#     sequential  sequential counter (Sinz), n-1 variables, 3n-4 clauses
+#     commander   groups of three with a commander variable each (Klieber,
+#                 Kwon), recursively on the commanders
+#     product     two dimensional product encoding (Chen), recursively on
+#                 the rows and columns
+#
+
+import math
+
+ENCODINGS = ('pairwise', 'sequential', 'commander', 'product')
+
+# groups at most this large are always encoded pairwise
+PAIRWISE_LIMIT = 6
+COMMANDER_GROUP = 3
+
+
+def neg_int(lit):
+    return -lit
+
+
+def at_most_one(literals, encoding='pairwise', new_var=None, neg=neg_int):
+    literals = list(literals)
+    if encoding not in ENCODINGS:
+        raise ValueError('Unknown cardinality encoding: {}'.format(encoding))
+    if encoding == 'pairwise' or len(literals) <= 1:
+        return pairwise(literals, neg)
+    if encoding == 'sequential':
+        return sequential(literals, new_var, neg)
+    if encoding == 'commander':
+        return commander(literals, new_var, neg)
+    return product(literals, new_var, neg)
+
+
+def exactly_one(literals, encoding='pairwise', new_var=None, neg=neg_int):
+    literals = list(literals)
+    yield literals
+    yield from at_most_one(literals, encoding, new_var, neg)
+
+
+def pairwise(literals, neg=neg_int):
+    for i in range(len(literals)):
+        for j in range(i+1, len(literals)):
+            yield [neg(literals[i]), neg(literals[j])]
+
+
+def sequential(literals, new_var, neg=neg_int):
+    n = len(literals)
+    if n <= 1:
+        return
+    s = [new_var() for _ in range(n-1)]
+    yield [neg(literals[0]), s[0]]
+    for i in range(1, n-1):
+        yield [neg(literals[i]), s[i]]
+        yield [neg(s[i-1]), s[i]]
+        yield [neg(literals[i]), neg(s[i-1])]
+    yield [neg(literals[n-1]), neg(s[n-2])]
+
+
+def commander(literals, new_var, neg=neg_int):
+    if len(literals) <= PAIRWISE_LIMIT:
+        yield from pairwise(literals, neg)
+        return
+    commanders = []
+    for i in range(0, len(literals), COMMANDER_GROUP):
+        group = literals[i:i+COMMANDER_GROUP]
+        c = new_var()
+        commanders.append(c)
+        yield from pairwise(group, neg)
+        for lit in group:
+            yield [neg(lit), c]
+    yield from commander(commanders, new_var, neg)
+
+
+def product(literals, new_var, neg=neg_int):
+    n = len(literals)
+    if n <= PAIRWISE_LIMIT:
+        yield from pairwise(literals, neg)
+        return
+    p = int(math.ceil(math.sqrt(n)))
+    q = int(math.ceil(n / p))
+    rows = [new_var() for _ in range(p)]
+    columns = [new_var() for _ in range(q)]
+    for k, lit in enumerate(literals):
+        yield [neg(lit), rows[k // q]]
+        yield [neg(lit), columns[k % q]]
+    yield from product(rows, new_var, neg)
+    yield from product(columns, new_var, neg)
+
+
+def aux_count(n, encoding='pairwise'):
+    """ Returns the number of auxiliary variables used for a group of *n*.
+
+        Counted the way the encodings above allocate them, without
+        generating their clauses.
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError('Unknown cardinality encoding: {}'.format(encoding))
+    if encoding == 'pairwise' or n <= 1:
+        return 0
+    if encoding == 'sequential':
+        return n - 1
+    if n <= PAIRWISE_LIMIT:
+        return 0
+    if encoding == 'commander':
+        groups = (n + COMMANDER_GROUP - 1) // COMMANDER_GROUP
+        return groups + aux_count(groups, encoding)
+    p = int(math.ceil(math.sqrt(n)))
+    q = int(math.ceil(n / p))
+    return p + q + aux_count(p, encoding) + aux_count(q, encoding)
@@ -0,0 +1,108 @@
+#
+# Random solvable levels for benchmarks.
+#
+# A room of the given size is surrounded by walls and sprinkled with inner
+# walls that keep the floor connected. Boxes start on targets and are
+# pulled away by the player, the reverse of a push, so the pushes back are
+# a plan. Pulls taking a box back towards its target are avoided while
+# there are others. Layouts whose boxes all end on their targets are drawn
+# again. The same arguments always give the same level.
+#
+
+import random
+from lib.level import Level, DIRECTIONS
+
+# layouts drawn before giving up on a level with a box off its target
+ATTEMPTS = 100
+
+
+def generate(width, height, boxes, pulls, seed=0, walls=0.15):
+    """ Returns a level of *width* x *height* squares, walls included, with *boxes* boxes.
+
+        The boxes are pulled up to *pulls* times, and further while they are all
+        back on their targets, and pushing them back is a plan. The level is
+        never solved already. *walls* is the share of inner squares turned
+        into walls.
+    """
+    rng = random.Random('{}x{}-{}-{}-{}'.format(width, height, boxes, pulls, seed))
+    floor = {(x, y) for x in range(1, height-1) for y in range(1, width-1)}
+    if len(floor) < boxes + 1:
+        raise ValueError('A {}x{} level has no room for {} boxes'.format(width, height, boxes))
+    inner = sorted(floor)
+    rng.shuffle(inner)
+    for XY in inner[:int(len(inner) * walls)]:
+        if len(floor) > boxes + 2 and connected(floor - {XY}):
+            floor.discard(XY)
+    for _ in range(ATTEMPTS):
+        targets = rng.sample(sorted(floor), boxes)
+        box_squares, player = scramble(rng, floor, targets, pulls)
+        if box_squares != set(targets):
+            break
+    else:
+        raise ValueError('No unsolved {}x{} level with {} boxes found'.format(width, height, boxes))
+    lines = []
+    for x in range(height):
+        line = ''
+        for y in range(width):
+            XY = (x, y)
+            if XY not in floor:
+                line += '#'
+            elif XY in box_squares:
+                line += '*' if XY in targets else '$'
+            elif XY == player:
+                line += '+' if XY in targets else '@'
+            else:
+                line += '.' if XY in targets else ' '
+        lines.append(line)
+    return Level(lines, 'gen-{}x{}-{}b-{}p-{}'.format(width, height, boxes, pulls, seed))
+
+
+def scramble(rng, floor, targets, pulls):
+    """ Returns the box squares and the player square after pulling the boxes away from *targets*. """
+    box_squares = set(targets)
+    origins = {XY: XY for XY in targets}
+    player = rng.choice(sorted(floor - box_squares))
+    done = 0
+    for _ in range(pulls * 20):
+        if done >= pulls and box_squares != set(targets):
+            break
+        area = walk_area(player, floor, box_squares)
+        candidates = []
+        for boxXY in sorted(box_squares):
+            for dx, dy in DIRECTIONS:
+                playerXY = (boxXY[0] - dx, boxXY[1] - dy)
+                backXY = (playerXY[0] - dx, playerXY[1] - dy)
+                if playerXY in area and backXY in floor and backXY not in box_squares:
+                    candidates.append((boxXY, playerXY, backXY))
+        if not candidates:
+            break
+        away = [pull for pull in candidates
+                if distance(pull[1], origins[pull[0]]) > distance(pull[0], origins[pull[0]])]
+        boxXY, playerXY, backXY = rng.choice(away or candidates)
+        box_squares.remove(boxXY)
+        box_squares.add(playerXY)
+        origins[playerXY] = origins.pop(boxXY)
+        player = backXY
+        done += 1
+    return (box_squares, player)
+
+
+def walk_area(start, floor, boxes):
+    """ Returns the squares of *floor* the player can walk to from *start* around *boxes*. """
+    area = {start}
+    queue = [start]
+    for XY in queue:
+        for dx, dy in DIRECTIONS:
+            neighbor = (XY[0] + dx, XY[1] + dy)
+            if neighbor in floor and neighbor not in boxes and neighbor not in area:
+                area.add(neighbor)
+                queue.append(neighbor)
+    return area
+
+
+def distance(c1, c2):
+    return abs(c1[0] - c2[0]) + abs(c1[1] - c2[1])
+
+
+def connected(floor):
+    return not floor or len(walk_area(next(iter(floor)), floor, ())) == len(floor)
@@ -0,0 +1,192 @@
+#
+# Sokoban levels stored as bitboards.
+#
+# Square (x, y), row x and column y, is bit x * width + y of a board. Two
+# legends are understood:
+#
+#     project   # wall, S player, X player on target, B box, T target
+#     XSB       # wall, @ player, + player on target, $ box,
+#               * box on target, . target, space - _ floor
+#
+# A file can hold a collection of levels, every block of consecutive map
+# lines is a level and the last other line before it, if any, its title. A
+# "Title:" line right after a block, as in .sok files, names that block.
+#
+
+import itertools
+import os
+
+PROJECT = {'#': 'wall', 'S': 'player', 'X': 'player target', 'B': 'box', 'T': 'target', ' ': ''}
+XSB = {'#': 'wall', '@': 'player', '+': 'player target', '$': 'box', '*': 'box target',
+       '.': 'target', ' ': '', '-': '', '_': ''}
+
+DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+def is_map_line(line):
+    line = line.rstrip('\r\n')
+    return '#' in line and all(char in PROJECT or char in XSB for char in line)
+
+
+class Level(object):
+
+    def __init__(self, lines, name=''):
+        """ Parses the map lines of one level in either legend. """
+        lines = [line.rstrip('\r\n') for line in lines]
+        self.name = name
+        self.height = len(lines)
+        self.width = max(len(line) for line in lines) if lines else 0
+        text = ''.join(lines)
+        legend = XSB if any(char in '@+$*.' for char in text) else PROJECT
+        self.walls = 0
+        self.box_board = 0
+        self.target_board = 0
+        self.player = None
+        self.boxes = []
+        self.targets = []
+        for x, line in enumerate(lines):
+            for y, char in enumerate(line):
+                if char not in legend:
+                    raise ValueError('Unknown map character {!r} in {}'.format(char, name or 'level'))
+                bit = 1 << self.cell(x, y)
+                kinds = legend[char].split()
+                if 'wall' in kinds:
+                    self.walls |= bit
+                if 'player' in kinds:
+                    self.player = (x, y)
+                if 'box' in kinds:
+                    self.box_board |= bit
+                    self.boxes.append((x, y))
+                if 'target' in kinds:
+                    self.target_board |= bit
+                    self.targets.append((x, y))
+        self.full = (1 << (self.height * self.width)) - 1
+        self.first_column = 0
+        for x in range(self.height):
+            self.first_column |= 1 << self.cell(x, 0)
+        self.last_column = self.first_column << max(self.width - 1, 0)
+        if self.player is None:
+            raise ValueError('No player in {}'.format(name or 'level'))
+        self.floor = self.flood(1 << self.cell(*self.player), self.full & ~self.walls)
+
+    @classmethod
+    def load(cls, file_name):
+        """ Returns the levels of a file, a single map or a collection. """
+        with open(file_name) as f:
+            return cls.parse(f, os.path.basename(file_name))
+
+    @classmethod
+    def parse(cls, lines, name=''):
+        levels = []
+        block = []
+        title = None
+        # the level whose map the lines read since its end follow without a blank line
+        previous = None
+        for line in itertools.chain(lines, ['']):
+            if is_map_line(line):
+                block.append(line)
+                continue
+            if block:
+                levels.append(cls(block, title or '{}#{}'.format(name, len(levels) + 1)))
+                previous = levels[-1]
+                block = []
+                title = None
+            if not line.strip():
+                previous = None
+                continue
+            text = line.strip().lstrip(';').strip()
+            if text.lower().startswith('title:'):
+                if previous is not None:
+                    previous.name = text[6:].strip()
+                    continue
+                text = text[6:].strip()
+            title = text
+        if len(levels) == 1 and levels[0].name == '{}#1'.format(name):
+            levels[0].name = name
+        return levels
+
+    def __repr__(self):
+        return 'Level({!r})'.format(self.name)
+
+    def canonical(self):
+        """ Returns the level in the XSB legend without its name.
+
+            Empty squares the player cannot reach are walls, so levels that
+            only differ there, in the legend or in trailing spaces are equal.
+        """
+        squares = self.floor | self.box_board | self.target_board
+        lines = []
+        for x in range(self.height):
+            line = ''
+            for y in range(self.width):
+                bit = 1 << self.cell(x, y)
+                if not squares & bit:
+                    line += '#'
+                elif (x, y) == self.player:
+                    line += '+' if self.target_board & bit else '@'
+                elif self.box_board & bit:
+                    line += '*' if self.target_board & bit else '$'
+                else:
+                    line += '.' if self.target_board & bit else ' '
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def cell(self, x, y):
+        return x * self.width + y
+
+    def square(self, cell):
+        return divmod(cell, self.width)
+
+    def is_wall(self, XY):
+        return self.inside(XY) and bool(self.walls >> self.cell(*XY) & 1)
+
+    def is_floor(self, XY):
+        return self.inside(XY) and bool(self.floor >> self.cell(*XY) & 1)
+
+    def is_box(self, XY):
+        return self.inside(XY) and bool(self.box_board >> self.cell(*XY) & 1)
+
+    def is_target(self, XY):
+        return self.inside(XY) and bool(self.target_board >> self.cell(*XY) & 1)
+
+    def inside(self, XY):
+        return 0 <= XY[0] < self.height and 0 <= XY[1] < self.width
+
+    def board(self, squares):
+        """ Returns the board with the bits of *squares* set. """
+        board = 0
+        for XY in squares:
+            board |= 1 << self.cell(*XY)
+        return board
+
+    def squares(self, board):
+        """ Returns the squares of the bits set on *board*, row by row. """
+        res = []
+        while board:
+            low = board & -board
+            res.append(self.square(low.bit_length() - 1))
+            board ^= low
+        return res
+
+    def shift(self, board, direction):
+        """ Moves every bit of *board* one square in *direction*, dropping those leaving the map. """
+        dx, dy = DIRECTIONS[direction]
+        if dx < 0:
+            return board >> self.width
+        if dx > 0:
+            return (board << self.width) & self.full
+        if dy < 0:
+            return (board & ~self.first_column) >> 1
+        return (board & ~self.last_column) << 1
+
+    def flood(self, board, passable):
+        """ Returns the squares of *passable* connected to *board*, which is included. """
+        area = board
+        while True:
+            grown = area
+            for direction in range(len(DIRECTIONS)):
+                grown |= self.shift(area, direction) & passable
+            if grown == area:
+                return area
+            area = grown
+
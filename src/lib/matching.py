@@ -0,0 +1,60 @@
+#
+# Minimum cost bipartite matching (Hungarian algorithm with potentials).
+#
+
+UNREACHABLE = 10 ** 6
+
+
+def min_cost_matching(costs):
+    """ Assigns every row of the matrix *costs* to a distinct column.
+
+        There must be at least as many columns as rows. Returns a pair
+        (total cost, list of the column assigned to each row). Use
+        UNREACHABLE for pairs that must not be matched, the total is at
+        least UNREACHABLE if no assignment avoids them.
+    """
+    n = len(costs)
+    if n == 0:
+        return (0, [])
+    m = len(costs[0])
+    u = [0] * (n+1)
+    v = [0] * (m+1)
+    owner = [0] * (m+1)
+    way = [0] * (m+1)
+    for i in range(1, n+1):
+        owner[0] = i
+        j0 = 0
+        minv = [float('inf')] * (m+1)
+        used = [False] * (m+1)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            delta = float('inf')
+            j1 = 0
+            for j in range(1, m+1):
+                if not used[j]:
+                    cur = costs[i0-1][j-1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(m+1):
+                if used[j]:
+                    u[owner[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+    assignment = [0] * n
+    for j in range(1, m+1):
+        if owner[j]:
+            assignment[owner[j]-1] = j-1
+    return (sum(costs[i][assignment[i]] for i in range(n)), assignment)
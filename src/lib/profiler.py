@@ -0,0 +1,71 @@
+#
+# Instrumentation of the solving phases.
+#
+# A Profiler builds one record per solved horizon: wall clock and CPU time
+# of every phase, variable and clause counts and the statistics printed by
+# the SAT solver. Finished records are passed to the hooks, callables taking
+# the record as a dict; JsonLines appends them to a file. CPU time includes
+# the child processes reaped during a phase, the SAT solvers.
+#
+
+import os
+import json
+import time
+import contextlib
+
+
+def cpu_time():
+    times = os.times()
+    return time.process_time() + times.children_user + times.children_system
+
+
+class Profiler(object):
+
+    def __init__(self, hooks=()):
+        self.hooks = list(hooks)
+        self.record = None
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def start(self, **fields):
+        """ Starts a new record holding *fields*, the phases are added by phase. """
+        self.record = dict(fields, phases={})
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """ Adds the wall clock and CPU time of the block to the phase *name* of the record. """
+        wall = time.perf_counter()
+        cpu = cpu_time()
+        try:
+            yield
+        finally:
+            if self.record is not None:
+                phase = self.record['phases'].setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+                phase['wall'] += time.perf_counter() - wall
+                phase['cpu'] += cpu_time() - cpu
+                phase['calls'] += 1
+
+    def finish(self, **fields):
+        """ Adds *fields* to the record and passes it to the hooks. """
+        record, self.record = self.record, None
+        if record is None:
+            return
+        record.update(fields)
+        for phase in record['phases'].values():
+            phase['wall'] = round(phase['wall'], 6)
+            phase['cpu'] = round(phase['cpu'], 6)
+        for hook in self.hooks:
+            hook(record)
+
+
+class JsonLines(object):
+    """ A hook appending every record to the file *file_name* as a line of JSON. """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+
+    def __call__(self, record):
+        # one write per record, so processes can append to the same file
+        with open(self.file_name, 'a') as f:
+            f.write(json.dumps(record, sort_keys=True) + '\n')
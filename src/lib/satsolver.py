@@ -0,0 +1,184 @@
+#
+# SAT solver backends.
+#
+# A backend runs one solver, or one configuration of a solver, on a DIMACS
+# theory and parses its own answer into (sat, model). solve runs several
+# backends on the same theory at once, takes the first answer and kills the
+# others. Backends are given by specs:
+#
+#     minisat                bundled MiniSat 2.2
+#     minisat-1.14           bundled MiniSat 1.14
+#     minisat:-rnd-freq=0.1  a bundled MiniSat with options, space separated
+#     path[:options]         any other solver printing SAT competition
+#                            output, "s SATISFIABLE" and "v" model lines
+#
+
+import os
+import re
+import sys
+import queue
+import threading
+import subprocess
+
+BUNDLED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'minisat')
+if sys.platform.startswith('win'):
+    BUNDLED = {'minisat': 'win/minisat.exe', 'minisat-1.14': 'win/MiniSat_v1.14.exe'}
+else:
+    BUNDLED = {'minisat': 'lin/minisat-2.2.0-linux', 'minisat-1.14': 'lin/MiniSat_v1.14_linux'}
+
+# name of the result file of the backend with the given index
+RESULT_FILE = 'out{}.txt'
+
+# a statistic printed by a solver, as "conflicts : 123 (45 /sec)" or "|  Parse time: 0.01 s |"
+STATISTIC = re.compile(r'^(?:c |\|)?\s*([A-Za-z][A-Za-z ]*?)\s*:\s*([-+]?[0-9]+(?:\.[0-9]*)?)')
+
+
+class Backend(object):
+    """ A SAT solver, or one configuration of it. """
+
+    def __init__(self, path, options=(), name=None):
+        self.path = path
+        self.options = list(options)
+        self.name = name or os.path.basename(path)
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.name)
+
+    def command(self, input_file, result_file):
+        """ Returns the command line reading *input_file*, see answer for *result_file*. """
+        raise NotImplementedError
+
+    def answer(self, returncode, output, result):
+        """ Returns (sat, model) from the exit code, standard output and result file of a run. """
+        raise NotImplementedError
+
+    def statistics(self, output):
+        """ Returns the statistics printed on the standard output as {name: number}. """
+        stats = {}
+        for line in output.split('\n'):
+            match = STATISTIC.match(line)
+            if match:
+                name = match.group(1).lower().replace(' ', '_')
+                value = match.group(2)
+                stats[name] = float(value) if '.' in value else int(value)
+        return stats
+
+
+class MiniSat(Backend):
+    """ MiniSat writes SAT or UNSAT and the model to its result file. """
+
+    def command(self, input_file, result_file):
+        return [self.path] + self.options + [input_file, result_file]
+
+    def answer(self, returncode, output, result):
+        """ Raises MemoryError on INDETERMINATE, MiniSat's answer when it runs out of memory. """
+        if returncode not in (10, 20):
+            if 'INDETERMINATE' in output:
+                raise MemoryError('{} ran out of memory'.format(self.name))
+            raise RuntimeError('{} failed with exit code {}'.format(self.name, returncode))
+        lines = result.split('\n')
+        for i, line in enumerate(lines):
+            if line.strip() == 'UNSAT':
+                return (False, [])
+            if line.strip() == 'SAT':
+                model = [int(v) for v in ' '.join(lines[i+1:]).split()]
+                return (True, [v for v in model if v != 0])
+        raise RuntimeError('{} gave no answer'.format(self.name))
+
+
+class CompetitionSolver(Backend):
+    """ A solver following the SAT competition output on its standard output. """
+
+    def command(self, input_file, result_file):
+        return [self.path] + self.options + [input_file]
+
+    def answer(self, returncode, output, result):
+        status = None
+        model = []
+        for line in output.split('\n'):
+            if line.startswith('s '):
+                status = line[2:].strip()
+            elif line.startswith('v '):
+                model.extend(int(v) for v in line[2:].split())
+        if status == 'UNSATISFIABLE':
+            return (False, [])
+        if status == 'SATISFIABLE':
+            return (True, [v for v in model if v != 0])
+        raise RuntimeError('{} failed with exit code {}'.format(self.name, returncode))
+
+
+def backend(spec):
+    """ Returns the backend given by *spec*, see the top of this module. """
+    if os.path.exists(spec):
+        return CompetitionSolver(spec)
+    name, _, options = spec.partition(':')
+    if name in BUNDLED:
+        return MiniSat(os.path.join(BUNDLED_DIR, BUNDLED[name]), options.split(), spec)
+    if os.path.exists(name):
+        return CompetitionSolver(name, options.split(), spec)
+    raise ValueError('Unknown SAT solver: {}'.format(spec))
+
+
+def solve(backends, theory, workdir=None, cancelled=None, poll=0.05):
+    """ Runs *backends* on the theory at once, returns (backend, sat, model, stats) of the first answer.
+
+        *theory* is DIMACS as bytes, piped to the solvers whose results are
+        read from their standard error, or the name of a DIMACS file, the
+        results are then written to *workdir*. The other solvers are killed
+        as soon as one answers. Returns None as soon as *cancelled* returns
+        True. If no solver answers, the error of the last one is raised.
+    """
+    answers = queue.Queue()
+    runs = []
+    try:
+        for index, solver in enumerate(backends):
+            if isinstance(theory, bytes):
+                args = solver.command('/dev/stdin', '/dev/stderr')
+                result_file = None
+                stdin = subprocess.PIPE
+            else:
+                result_file = os.path.join(workdir, RESULT_FILE.format(index))
+                args = solver.command(theory, result_file)
+                stdin = subprocess.DEVNULL
+            popen = subprocess.Popen(args, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            data = theory if result_file is None else None
+            thread = threading.Thread(target=wait, args=(solver, popen, data, result_file, answers))
+            thread.start()
+            runs.append((popen, thread))
+        error = None
+        for _ in runs:
+            while True:
+                try:
+                    solver, answer = answers.get(timeout=None if cancelled is None else poll)
+                    break
+                except queue.Empty:
+                    if cancelled():
+                        return None
+            if isinstance(answer, Exception):
+                error = answer
+                continue
+            return (solver,) + answer
+        raise error
+    finally:
+        for popen, thread in runs:
+            if popen.poll() is None:
+                popen.kill()
+            thread.join()
+
+
+def wait(solver, popen, data, result_file, answers):
+    """ Feeds *data* to a solver, waits for it and puts its answer or error in the queue. """
+    try:
+        output, errors = popen.communicate(data)
+        if result_file is None:
+            result = errors.decode()
+        elif os.path.exists(result_file):
+            with open(result_file) as f:
+                result = f.read()
+        else:
+            result = ''
+        output = output.decode()
+        sat, model = solver.answer(popen.returncode, output, result)
+        answers.put((solver, (sat, model, solver.statistics(output))))
+    except Exception as e:
+        answers.put((solver, e))
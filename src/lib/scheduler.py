@@ -0,0 +1,137 @@
+import concurrent.futures
+import multiprocessing
+
+
+class HorizonScheduler(object):
+    """ Probes several plan horizons at once on a pool of worker processes.
+
+        *probe* is called in a worker as probe(horizon) and returns a pair
+        (solution_found, solution), with solution_found None if the probe was
+        cancelled. Workers are set up by initializer(bound, *initargs), where
+        *bound* is a shared value holding the shortest satisfiable horizon
+        found so far. Probes for longer horizons should give up as soon as
+        they notice it dropped below their own horizon.
+
+        Strategies:
+            window       probes the shortest horizons not yet known, *jobs*
+                         at a time
+            exponential  probes n and n+1 for n = first, 2*first,
+                         4*first, ... until a plan is found and then
+                         bisects the horizons below it
+
+        Horizons shorter than *first*, a known lower bound, are never probed.
+
+        Every action moves the player and the player can always step back
+        to the square it came from, so a plan of length n can be stretched
+        to length n+2. Bisection therefore searches odd and even horizons
+        separately.
+    """
+
+    STRATEGIES = ('window', 'exponential')
+
+    def __init__(self, probe, initializer, initargs, limit, jobs=1, strategy='window',
+                 minimal=False, report=None, first=1):
+        if strategy not in self.STRATEGIES:
+            raise ValueError('Unknown strategy: {}'.format(strategy))
+        self.probe = probe
+        self.initializer = initializer
+        self.initargs = initargs
+        self.limit = limit
+        self.jobs = jobs
+        self.strategy = strategy
+        self.minimal = minimal
+        self.report = report
+        self.first = first
+        self.results = {}
+
+    def run(self):
+        """ Returns (horizon, solution) of the plan found, or (None, []). """
+        self.results = {}
+        bound = multiprocessing.Value('i', self.limit + 1)
+        running = {}
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs,
+                                                      initializer=self.initializer,
+                                                      initargs=(bound,) + tuple(self.initargs))
+        try:
+            while not self.finished():
+                for horizon in self.candidates(set(running.values())):
+                    if len(running) >= self.jobs:
+                        break
+                    running[pool.submit(self.probe, horizon)] = horizon
+                if not running:
+                    break
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    horizon = running.pop(future)
+                    solution_found, solution = future.result()
+                    if solution_found is None:
+                        continue
+                    self.results[horizon] = (solution_found, solution)
+                    if self.report is not None:
+                        self.report(horizon, solution_found)
+                    if solution_found and horizon < bound.value:
+                        with bound.get_lock():
+                            bound.value = min(bound.value, horizon)
+        finally:
+            for future in running:
+                future.cancel()
+            bound.value = 0
+            pool.shutdown(wait=True)
+        best = self.best()
+        if best is None:
+            return (None, [])
+        return (best, self.results[best][1])
+
+    def best(self):
+        found = [horizon for horizon, (solution_found, _) in self.results.items() if solution_found]
+        return min(found) if found else None
+
+    def finished(self):
+        best = self.best()
+        if best is None:
+            return False
+        if not self.minimal:
+            return True
+        return not any(True for _ in self.candidates(set()))
+
+    def candidates(self, running):
+        """ Yields the horizons worth probing next, most useful first. """
+        best = self.best()
+        if self.strategy == 'window':
+            last = self.limit if best is None else best - 1
+            for horizon in range(self.first, last + 1):
+                if horizon not in self.results and horizon not in running:
+                    yield horizon
+        elif best is None:
+            for horizon in self.exponential_sequence():
+                if horizon not in self.results and horizon not in running:
+                    yield horizon
+        else:
+            for parity in (best % 2, 1 - best % 2):
+                horizons = self.bisection_range(parity, best)
+                if horizons:
+                    middle = horizons[len(horizons) // 2]
+                    if middle not in running:
+                        yield middle
+
+    def exponential_sequence(self):
+        horizons = [self.first, self.first + 1]
+        n = 2
+        while n * self.first + 1 < self.limit:
+            horizons += [n * self.first, n * self.first + 1]
+            n *= 2
+        horizons += [self.limit - 1, self.limit]
+        return sorted(set(horizon for horizon in horizons if self.first <= horizon <= self.limit))
+
+    def bisection_range(self, parity, best):
+        """ Returns the unresolved horizons of the given parity below *best*. """
+        low = self.first - 2 if self.first % 2 == parity else self.first - 1
+        high = best + 1
+        for horizon, (solution_found, _) in self.results.items():
+            if horizon % 2 != parity:
+                continue
+            if solution_found:
+                high = min(high, horizon)
+            else:
+                low = max(low, horizon)
+        return [horizon for horizon in range(low + 2, high, 2) if horizon >= self.first]
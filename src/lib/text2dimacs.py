@@ -18,61 +18,132 @@
 #     -1 2 0
 #
 
+import os
+import shutil
+import tempfile
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+HEADER_WIDTH = 32
+
 class VariableMap(dict):
     def maxVar(self):
-        import functools
-        return functools.reduce(max, self.values(), 0)
+        return len(self)
     def __missing__(self, key):
-        val = self.maxVar() + 1
+        val = len(self) + 1
         self[key] = val
         return val
 
-def translate(inf, outf):
-    clauses = []
-    varMap = VariableMap()
-    with open(inf,'r') as f: 
-        for line in f:
-            clause = []
+def patchable(f):
+    """ Returns True if a line written to *f* can be overwritten later.
+
+        A file opened for appending is seekable, but every write goes to its
+        end, whether opened by Python or by the shell redirecting stdout.
+    """
+    if not f.seekable() or 'a' in getattr(f, 'mode', ''):
+        return False
+    if fcntl is not None:
+        try:
+            return not fcntl.fcntl(f.fileno(), fcntl.F_GETFL) & os.O_APPEND
+        except (AttributeError, OSError, ValueError):
+            pass
+    return True
+
+def translate(inf, outf, varsf='variables.txt', comments=True):
+    """ Translates textual CNF from *inf* into dimacs written to *outf*.
+
+        Both can be file names or open files. The input is read in a single
+        pass and clauses are written as they are parsed, so only the variable
+        map is kept in memory. The problem line is patched in afterwards if
+        the output is seekable and not opened for appending, otherwise the
+        clauses are spooled through a temporary file. Variable names are
+        written to *varsf* unless it is None, source lines are echoed as
+        comments when *comments* is set.
+    """
+    fin = open(inf, 'r', encoding='utf-8') if isinstance(inf, str) else inf
+    fout = open(outf, 'w') if isinstance(outf, str) else outf
+    fvars = open(varsf, 'w') if varsf is not None else None
+    try:
+        seekable = patchable(fout)
+        body = fout if seekable else tempfile.TemporaryFile('w+')
+        if seekable:
+            start = fout.tell()
+            fout.write(' ' * HEADER_WIDTH + '\n')
+        varMap = VariableMap()
+        count = 0
+        for line in fin:
             tokens = line.split()
             if len(tokens) == 0 or tokens[0] == 'c':
                 continue
 
-            for w in line.split():
+            clause = []
+            for w in tokens:
                 if w in ['∨', 'v']:
                     continue
 
                 neg  = w[0] in ['¬', '-']
                 if neg:
                     w = w[1:]
-                clause.append(varMap[w] * (-1 if neg else 1))
-
-            clauses.append((line,clause))
+                var = varMap.get(w)
+                if var is None:
+                    var = varMap[w]
+                    if fvars is not None:
+                        fvars.write('%d\n%s\n' % (var, w))
+                clause.append('-%d' % var if neg else '%d' % var)
 
-    with open(outf,'w') as f:
-        f.write('p cnf %d %d\n' % (varMap.maxVar(), len(clauses)))
+            if comments:
+                body.write('c %s\n' % line.rstrip('\n'))
+            body.write('%s 0\n' % ' '.join(clause))
+            count += 1
 
-        for line, clause in clauses:
-            f.write('c %s' % line)
-            f.write('%s 0\n' % ' '.join([str(x) for x in clause]))
-
-    with open('variables.txt', 'w') as f:
-        # dicts are hashed, so 'normal' order is not very nice
-        for num, var in sorted([(num,var) for var,num in varMap.items()]):
-            f.write('%d\n%s\n' % (num, var))
+        header = 'p cnf %d %d' % (varMap.maxVar(), count)
+        if seekable:
+            end = fout.tell()
+            fout.seek(start)
+            fout.write(header.ljust(HEADER_WIDTH))
+            fout.seek(end)
+        else:
+            fout.write(header + '\n')
+            body.seek(0)
+            shutil.copyfileobj(body, fout)
+            body.close()
+    finally:
+        if fin is not inf:
+            fin.close()
+        if fout is not outf:
+            fout.close()
+        if fvars is not None:
+            fvars.close()
+    return varMap
 
 
 if __name__ == '__main__':
     import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Converts textual CNF into dimacs.')
+    parser.add_argument('input', nargs='?', help='textual CNF (default: stdin)')
+    parser.add_argument('output', nargs='?', help='dimacs output (default: stdout)')
+    parser.add_argument('--variables', default='variables.txt',
+                        help='file for the variable names (default: %(default)s)')
+    parser.add_argument('--no-variables', action='store_true',
+                        help='do not write the variable names')
+    parser.add_argument('--strip-comments', action='store_true',
+                        help='do not echo source lines as comments')
+    args = parser.parse_args()
 
     inf = sys.stdin
-    if len(sys.argv) > 1:
-        inf = open(sys.argv[1], 'r', encoding='utf-8')
+    if args.input is not None:
+        inf = open(args.input, 'r', encoding='utf-8')
 
     outf = sys.stdout
-    if len(sys.argv) > 2:
-        outf = open(sys.argv[2], 'w', encoding='utf-8')
+    if args.output is not None:
+        outf = open(args.output, 'w', encoding='utf-8')
 
-    translate(inf, outf)
+    translate(inf, outf, None if args.no_variables else args.variables,
+              not args.strip_comments)
 
     if inf is not sys.stdin:
         inf.close()
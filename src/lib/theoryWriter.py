@@ -1,18 +1,46 @@
+import io
+
+
+# size of the buffer between the writers and their output files, in bytes
+BUFFER_SIZE = 1 << 20
+
+
 class TheoryWriter(object):
     
-    def __init__(self, filename):
+    def __init__(self, filename=None, comments=True, buffer_size=BUFFER_SIZE):
+        """ Writes to the file *filename*, or to memory if it is None.
+
+            Files are written through a buffer of *buffer_size* bytes and
+            only flushed by finish and close. Comments are dropped unless
+            *comments* is set.
+        """
         self.fn = filename
-        self.f = open(filename, 'w')
+        self.buffer_size = buffer_size
+        self.comments = comments
+        if not comments:
+            self.writeComment = self.skipComment
+        self.clauses = 0
+        self.f = self.open()
+
+    def open(self):
+        if self.fn is None:
+            return io.StringIO()
+        return open(self.fn, 'w', buffering=self.buffer_size)
 
     def new_iteration(self):
         if not self.closed():
             self.f.close()
-        self.f = open(self.fn, 'w')
+        self.clauses = 0
+        self.f = self.open()
 
     def filename(self):
-        """ Returns the filename that this writer writes to as a string."""
+        """ Returns the filename that this writer writes to as a string, None in memory."""
         return self.fn
 
+    def getvalue(self):
+        """ Returns everything written since the last iteration, the writer must be in memory. """
+        return self.f.getvalue()
+
     def writeLiteral(self, lit):
         """ Writes a single literal.
 
@@ -23,16 +51,22 @@ class TheoryWriter(object):
     def finishClause(self):
         """" Finishes current clause (writes a newline)."""
         self.f.write('\n')
-        self.f.flush()
+        self.clauses += 1
 
     def writeClause(self, clause):
         """ Writes a single clause.
 
             *clause* must be a list of literals.
         """
-        for l in clause:
-            self.writeLiteral(l)
-        self.finishClause()
+        self.f.write(' '.join(clause))
+        self.f.write('\n')
+        self.clauses += 1
+
+    def writeClauses(self, clauses):
+        """ Writes every clause of the iterable *clauses* in a single write. """
+        lines = [' '.join(clause) + '\n' for clause in clauses]
+        self.f.write(''.join(lines))
+        self.clauses += len(lines)
 
     def writeImpl(self, left, right):
         """ Writes an implication *left* => *right*. """
@@ -43,13 +77,100 @@ class TheoryWriter(object):
 
             Note that this does not work inside an unfinished clause!
         """
-        for line in comment.split('\n'):
-            self.f.write('c {}\n'.format(line))
+        self.f.write(''.join(['c {}\n'.format(line) for line in comment.split('\n')]))
+
+    def skipComment(self, comment):
+        """ Replaces writeComment when comments are disabled. """
+
+    def mark(self):
+        """ Returns the current position and clause count, see rewind. """
+        return (self.f.tell(), self.clauses)
+
+    def rewind(self, mark):
+        """ Discards clauses written after *mark* was taken. """
+        position, self.clauses = mark
+        self.f.seek(position)
+        self.f.truncate()
+
+    def block(self, mark):
+        """ Returns the clauses written after *mark* was taken and their number, see writeBlock.
+
+            The writer must be in memory.
+        """
+        position, clauses = mark
+        return (self.f.getvalue()[position:], self.clauses - clauses)
+
+    def writeBlock(self, block):
+        """ Appends a block returned by block of another writer of the same kind. """
+        text, clauses = block
+        self.f.write(text)
+        self.clauses += clauses
 
     def closed(self):
         """ Returs True if the output file has been already closed. """
         return self.f.closed
 
+    def flush(self):
+        """ Writes the buffer out to the file. """
+        self.f.flush()
+
     def close(self):
         """ Closes the output file. """
         self.f.close()
+
+
+class DimacsWriter(TheoryWriter):
+    """ Writes clauses of integer literals directly in DIMACS format.
+
+        The problem line is reserved at the top of the file and filled in
+        by finish, once the number of variables and clauses is known.
+    """
+
+    HEADER_WIDTH = 32
+
+    def __init__(self, filename=None, comments=False, buffer_size=BUFFER_SIZE):
+        super().__init__(filename, comments, buffer_size)
+        self.start()
+
+    def new_iteration(self):
+        super().new_iteration()
+        self.start()
+
+    def start(self):
+        self.f.write(' ' * self.HEADER_WIDTH + '\n')
+
+    def finishClause(self):
+        """ Finishes current clause (writes a zero and a newline)."""
+        self.f.write('0\n')
+        self.clauses += 1
+
+    def writeClause(self, clause):
+        """ Writes a single clause.
+
+            *clause* must be a list of integer literals.
+        """
+        self.f.write(' '.join(map(str, clause)))
+        self.f.write(' 0\n')
+        self.clauses += 1
+
+    def writeClauses(self, clauses):
+        """ Writes every clause of the iterable *clauses* in a single write. """
+        lines = [' '.join(map(str, clause)) + ' 0\n' for clause in clauses]
+        self.f.write(''.join(lines))
+        self.clauses += len(lines)
+
+    def writeImpl(self, left, right):
+        """ Writes an implication *left* => *right*. """
+        self.writeClause([-left, right])
+
+    def finish(self, variables):
+        """ Fills in the problem line and flushes the output file.
+
+            Clauses can still be appended afterwards, finish has to be
+            called again to update the problem line.
+        """
+        end = self.f.tell()
+        self.f.seek(0)
+        self.f.write('p cnf {} {}'.format(variables, self.clauses).ljust(self.HEADER_WIDTH))
+        self.f.seek(end)
+        self.f.flush()
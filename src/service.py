@@ -0,0 +1,369 @@
+#
+# Local solve service.
+#
+# Clients connect to a Unix or TCP socket and send requests as lines of
+# JSON, the answers come back as lines of JSON in the order they finish:
+#
+#     {"id": 1, "level": "#####\n#@$.#\n#####", "limit": 30, "timeout": 10}
+#     {"id": 1, "status": "solved", "length": 1, "pushes": 1, "plan": [...], "time": 0.01}
+#     {"cancel": 1}
+#
+# The level is given as map text, "index" picks a level of a collection.
+# "backend" and "options" are as in batch.py, a subset of the solver
+# options. The requests wait in a bounded queue for a pool of worker
+# processes that stay alive between requests, so modules are imported and
+# solvers set up once. A request equal to one queued or being solved, the
+# same level with the same options and limit, waits for its result instead
+# of solving it again; each request keeps its own timeout, counted from its
+# arrival. A worker solving a request nobody waits for any more, because
+# they timed out or were cancelled, is killed with its SAT solvers and
+# replaced.
+#
+
+import os
+import sys
+import json
+import shutil
+import signal
+import asyncio
+import argparse
+import tempfile
+import functools
+import contextlib
+import multiprocessing
+import concurrent.futures
+from SokobanSolver import SokobanSolver
+from lib.level import Level
+from lib.cache import ResultCache
+import lib.satsolver
+import batch
+
+# options a request can set, per backend
+REQUEST_OPTIONS = {
+    'sat': ('encoding', 'cardinality', 'frame', 'boxes', 'semantics', 'prune_dead', 'reachability',
+            'lower_bound', 'incremental'),
+    'search': ('algorithm', 'metric', 'prune_dead'),
+}
+
+# workers are not forked from the service, a forked worker would inherit the
+# pipes of the others and keep them open when they are killed
+if 'forkserver' in multiprocessing.get_all_start_methods():
+    CONTEXT = multiprocessing.get_context('forkserver')
+else:
+    CONTEXT = multiprocessing.get_context('spawn')
+
+
+def worker_main(conn, memory, workdir):
+    """ Solves the jobs received through *conn* until it is closed. """
+    if hasattr(os, 'setsid'):
+        os.setsid()
+    if memory and batch.resource is not None:
+        batch.resource.setrlimit(batch.resource.RLIMIT_AS, (memory * 2**20, memory * 2**20))
+    sys.stdout = open(os.devnull, 'w')
+    while True:
+        try:
+            level, backend, options, limit = conn.recv()
+        except EOFError:
+            break
+        conn.send(batch.solve(level, backend, options, limit, workdir))
+
+
+class Worker(object):
+    """ A worker process with its work directory, restarted when a job is given up. """
+
+    def __init__(self, memory, workroot, executor):
+        self.memory = memory
+        self.workroot = workroot
+        self.executor = executor
+        self.process = None
+        self.conn = None
+        self.workdir = None
+
+    def start(self):
+        self.conn, child = CONTEXT.Pipe()
+        self.workdir = tempfile.mkdtemp(dir=self.workroot)
+        self.process = CONTEXT.Process(target=worker_main, args=(child, self.memory, self.workdir), daemon=True)
+        self.process.start()
+        child.close()
+
+    def stop(self):
+        batch.kill(self.process)
+        self.conn.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    async def run(self, args):
+        """ Returns the result of the job *args*, kills the worker when cancelled. """
+        self.conn.send(args)
+        # the result is awaited on a thread, the connection is closed only after
+        # the thread returns, killing the worker makes it return at once
+        receiving = asyncio.get_running_loop().run_in_executor(self.executor, self.conn.recv)
+        try:
+            return await asyncio.shield(receiving)
+        except EOFError:
+            exitcode = self.process.exitcode
+            self.stop()
+            self.start()
+            return {'status': 'error', 'message': 'worker exited with code {}'.format(exitcode)}
+        except asyncio.CancelledError:
+            batch.kill(self.process)
+            with contextlib.suppress(EOFError):
+                await receiving
+            self.stop()
+            self.start()
+            raise
+
+
+class Job(object):
+    """ A level to solve and the requests waiting for it. """
+
+    def __init__(self, key, args):
+        self.key = key
+        self.args = args
+        self.result = asyncio.get_running_loop().create_future()
+        self.waiters = 0
+        self.task = None
+        self.cancelled = False
+
+
+class SolveService(object):
+
+    def __init__(self, jobs, queue_size, limit, timeout, memory=0, options=None):
+        self.jobs = jobs
+        self.limit = limit
+        self.timeout = timeout
+        self.memory = memory
+        self.options = options or {}
+        self.queue = asyncio.Queue(queue_size)
+        self.pending = {}
+        self.workers = []
+        self.tasks = []
+        self.workroot = None
+        self.executor = None
+
+    def start(self):
+        self.workroot = tempfile.mkdtemp(prefix='sokoban-service-')
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.jobs)
+        for _ in range(self.jobs):
+            worker = Worker(self.memory, self.workroot, self.executor)
+            worker.start()
+            self.workers.append(worker)
+            self.tasks.append(asyncio.ensure_future(self.consume(worker)))
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        for worker in self.workers:
+            worker.stop()
+        self.executor.shutdown()
+        shutil.rmtree(self.workroot, ignore_errors=True)
+
+    def job(self, request):
+        """ Returns (job, timeout) for *request*, raises ValueError if it is invalid. """
+        backend = request.get('backend', 'sat')
+        if backend not in REQUEST_OPTIONS:
+            raise ValueError('Unknown backend: {}'.format(backend))
+        options = request.get('options', {})
+        if not isinstance(options, dict):
+            raise ValueError('Options must be an object')
+        for name in options:
+            if name not in REQUEST_OPTIONS[backend]:
+                raise ValueError('Option {} cannot be set'.format(name))
+        if backend == 'sat':
+            options = dict(self.options, **options)
+        limit = request.get('limit', self.limit)
+        if not isinstance(limit, int) or limit < 1:
+            raise ValueError('Limit must be a positive number')
+        text = request.get('level')
+        if not isinstance(text, str):
+            raise ValueError('No level given')
+        levels = Level.parse(text.split('\n'), 'request')
+        index = request.get('index', 1)
+        if not isinstance(index, int) or not 1 <= index <= len(levels):
+            raise ValueError('The map has {} levels, no level {}'.format(len(levels), index))
+        level = levels[index - 1]
+        timeout = request.get('timeout', self.timeout)
+        if timeout is not None and not isinstance(timeout, (int, float)):
+            raise ValueError('Timeout must be a number')
+        # the validation of the options is left to the solver, and so is their effect on the key
+        key = ResultCache.key(level, {'backend': backend, 'options': options, 'limit': limit})
+        return (Job(key, (level, backend, options, limit)), timeout if timeout and timeout > 0 else None)
+
+    async def submit(self, request):
+        """ Returns the result dict of *request*, solving it or waiting for an equal request.
+
+            Every request waits for its own timeout, queued or solving. The
+            job is given up once no request waits for it any more.
+        """
+        try:
+            job, timeout = self.job(request)
+        except ValueError as e:
+            return {'status': 'error', 'message': str(e)}
+        if job.key in self.pending:
+            job = self.pending[job.key]
+        else:
+            try:
+                self.queue.put_nowait(job)
+            except asyncio.QueueFull:
+                return {'status': 'busy'}
+            self.pending[job.key] = job
+        job.waiters += 1
+        try:
+            return dict(await asyncio.wait_for(asyncio.shield(job.result), timeout))
+        except asyncio.TimeoutError:
+            return {'status': 'timeout', 'time': timeout}
+        finally:
+            job.waiters -= 1
+            if not job.waiters and not job.result.done():
+                self.cancel(job)
+
+    def cancel(self, job):
+        job.cancelled = True
+        if self.pending.get(job.key) is job:
+            del self.pending[job.key]
+        if job.task is not None:
+            job.task.cancel()
+
+    async def consume(self, worker):
+        while True:
+            job = await self.queue.get()
+            if job.cancelled:
+                continue
+            job.task = asyncio.ensure_future(worker.run(job.args))
+            try:
+                result = await job.task
+            except asyncio.CancelledError:
+                if not job.cancelled:
+                    raise
+                result = {'status': 'cancelled'}
+            if self.pending.get(job.key) is job:
+                del self.pending[job.key]
+            if not job.result.done():
+                job.result.set_result(result)
+
+    async def handle(self, reader, writer):
+        """ Answers the requests of one connection, cancels them when it is closed. """
+        requests = {}
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line.decode())
+                    if not isinstance(request, dict):
+                        raise ValueError('A request must be an object')
+                except ValueError as e:
+                    await self.send(writer, {'status': 'error', 'message': str(e)})
+                    continue
+                # ids can be any JSON value, they are told apart by their text
+                if 'cancel' in request:
+                    request_id = json.dumps(request['cancel'], sort_keys=True)
+                    if request_id in requests:
+                        requests[request_id].cancel()
+                    continue
+                request_id = json.dumps(request.get('id'), sort_keys=True)
+                task = asyncio.ensure_future(self.answer(request, writer))
+                requests[request_id] = task
+                task.add_done_callback(functools.partial(forget, requests, request_id))
+        except ConnectionError:
+            pass
+        finally:
+            for task in list(requests.values()):
+                task.cancel()
+            writer.close()
+
+    async def answer(self, request, writer):
+        try:
+            result = await self.submit(request)
+        except asyncio.CancelledError:
+            result = {'status': 'cancelled'}
+        result['id'] = request.get('id')
+        await self.send(writer, result)
+
+    async def send(self, writer, result):
+        if writer.is_closing():
+            return
+        writer.write((json.dumps(result, sort_keys=True) + '\n').encode())
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+def forget(requests, request_id, task):
+    if requests.get(request_id) is task:
+        del requests[request_id]
+
+
+async def serve(service, args):
+    if os.name == 'posix':
+        for signum in (signal.SIGTERM, signal.SIGHUP):
+            asyncio.get_running_loop().add_signal_handler(signum, asyncio.current_task().cancel)
+    service.start()
+    try:
+        if args.socket:
+            server = await asyncio.start_unix_server(service.handle, path=args.socket)
+            sys.stderr.write('Listening on {}\n'.format(args.socket))
+        else:
+            server = await asyncio.start_server(service.handle, args.host, args.port)
+            sys.stderr.write('Listening on {}:{}\n'.format(args.host, args.port))
+        sys.stderr.flush()
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Solves levels sent as lines of JSON to a socket '
+                                                 'on a pool of worker processes.')
+    parser.add_argument('--socket', help='Unix socket to listen on instead of TCP')
+    parser.add_argument('--host', default='127.0.0.1', help='TCP address to listen on (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=8765, help='TCP port to listen on (default: %(default)s)')
+    parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes (default: %(default)s)')
+    parser.add_argument('--queue', type=int, default=64,
+                        help='number of requests waiting for a worker, more are answered as busy '
+                             '(default: %(default)s)')
+    parser.add_argument('--time-limit', type=float, default=60,
+                        help='wall clock seconds per request unless it gives its timeout, 0 for none '
+                             '(default: %(default)s)')
+    parser.add_argument('--memory-limit', type=int, default=0,
+                        help='megabytes of memory per worker, 0 for none (default: %(default)s)')
+    parser.add_argument('--limit', type=int, default=SokobanSolver.LIMIT,
+                        help='maximal number of steps unless a request gives its limit (default: %(default)s)')
+    parser.add_argument('--solver', dest='solvers', action='append',
+                        help='SAT solver of the SAT backend, several make a portfolio (default: minisat)')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='cache directory of the SAT backend shared by the workers')
+    args = parser.parse_args()
+
+    if args.jobs < 1:
+        parser.error('number of jobs must be greater than zero')
+    if args.queue < 1:
+        parser.error('queue size must be greater than zero')
+    if args.socket and not hasattr(asyncio, 'start_unix_server'):
+        parser.error('Unix sockets are not available here')
+    for spec in args.solvers or []:
+        try:
+            lib.satsolver.backend(spec)
+        except ValueError:
+            parser.error('unknown SAT solver: {}'.format(spec))
+    if CONTEXT.get_start_method() == 'forkserver':
+        # workers start without importing the solver again
+        CONTEXT.set_forkserver_preload(['batch'])
+    service = SolveService(args.jobs, args.queue, args.limit, args.time_limit, args.memory_limit,
+                           {'solvers': args.solvers or ['minisat'], 'cache': args.cache})
+    try:
+        asyncio.run(serve(service, args))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,150 @@
 import sys
-import subprocess
+import argparse
 from SokobanSolver import SokobanSolver
+from SokobanSearch import SokobanSearch
+from lib.scheduler import HorizonScheduler
+import lib.cardinality
+import lib.satsolver
+import lib.cache
+from lib.level import Level
+import batch
 
-if len(sys.argv) < 2:
-    print('Give me an input file with map\nAborting')
-    sys.exit(0)
 
-ss = SokobanSolver(sys.argv[1])
+def main():
+    parser = argparse.ArgumentParser(description='Solves a sokoban map using a SAT solver.')
+    parser.add_argument('map', nargs='?', help='input file with map')
+    parser.add_argument('limit', nargs='?', help='maximal number of steps')
+    parser.add_argument('--level', type=int, default=1,
+                        help='number of the level in a file with a collection of levels (default: %(default)s)')
+    parser.add_argument('--backend', choices=('sat', 'search', 'race'), default='sat',
+                        help='solve with MiniSat, by explicit state search or with both at once, '
+                             'taking the first plan (default: %(default)s)')
+    parser.add_argument('--algorithm', choices=SokobanSearch.ALGORITHMS, default='astar',
+                        help='algorithm of the search backend (default: %(default)s)')
+    parser.add_argument('--metric', choices=SokobanSearch.METRICS, default='moves',
+                        help='cost minimized by the search backend (default: %(default)s)')
+    parser.add_argument('--solver', dest='solvers', action='append',
+                        help='SAT solver: minisat, minisat-1.14, either followed by a colon and options, '
+                             'or the path of a solver with SAT competition output; given several times, '
+                             'all of them run on every horizon and the first answer wins (default: minisat)')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of horizons probed in parallel (default: %(default)s)')
+    parser.add_argument('--encode-jobs', type=int, default=1,
+                        help='number of processes encoding the steps of a horizon, only faster with '
+                             'free cores and many steps per horizon (default: %(default)s)')
+    parser.add_argument('--schedule', choices=HorizonScheduler.STRATEGIES, default='window',
+                        help='order in which horizons are probed (default: %(default)s)')
+    parser.add_argument('--minimal', action='store_true',
+                        help='keep probing until the shortest plan is proven')
+    parser.add_argument('--encoding', choices=SokobanSolver.ENCODINGS, default='dimacs',
+                        help='dimacs numbers variables while encoding, text writes named predicates '
+                             'and translates them afterwards (default: %(default)s)')
+    parser.add_argument('--cardinality', choices=lib.cardinality.ENCODINGS, default='sequential',
+                        help='encoding of the at-most-one constraints (default: %(default)s)')
+    parser.add_argument('--frame', choices=SokobanSolver.FRAMES, default='explanatory',
+                        help='explanatory frame axioms list the actions that can change a fluent, '
+                             'classic ones keep every fluent for every other action (default: %(default)s)')
+    parser.add_argument('--boxes', choices=SokobanSolver.BOXES, default='labeled',
+                        help='labeled boxes each have their own variables, unlabeled ones share a single '
+                             'set and need the explanatory frame (default: %(default)s)')
+    parser.add_argument('--semantics', choices=SokobanSolver.SEMANTICS, default='sequential',
+                        help='parallel steps let the player walk any distance and then push once, '
+                             'push steps are single pushes and the walks are found afterwards '
+                             '(default: %(default)s)')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='append a JSON line per horizon to FILE with the time of every phase, '
+                             'the variable and clause counts and the SAT solver statistics')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='keep the unsatisfiable horizons and the plans found in DIR and reuse them')
+    parser.add_argument('--cache-size', type=int, default=lib.cache.MAX_SIZE // 2**20, metavar='MB',
+                        help='size limit of the cache directory, the least recently used levels are '
+                             'removed (default: %(default)s)')
+    parser.add_argument('--no-prune-dead', dest='prune_dead', action='store_false',
+                        help='keep box variables and pushes for squares no box can leave towards a target')
+    parser.add_argument('--no-reachability', dest='reachability', action='store_false',
+                        help='do not fix positions and actions that are unreachable at a step')
+    parser.add_argument('--no-lower-bound', dest='lower_bound', action='store_false',
+                        help='start at one step instead of a lower bound on the plan length')
+    parser.add_argument('--no-incremental', dest='incremental', action='store_false',
+                        help='encode every horizon from scratch instead of extending the previous one')
+    args = parser.parse_args()
+
+    if args.map is None:
+        print('Give me an input file with map\nAborting')
+        sys.exit(0)
+
+    if args.jobs < 1:
+        print('Number of jobs must be greater than zero\nAborting')
+        sys.exit(0)
+
+    if args.encode_jobs < 1:
+        print('Number of encoding jobs must be greater than zero\nAborting')
+        sys.exit(0)
+
+    if args.backend == 'sat' and args.semantics != 'sequential' and args.frame == 'classic':
+        parser.error('--semantics {} needs the explanatory frame axioms'.format(args.semantics))
+    if args.backend == 'sat' and args.boxes == 'unlabeled' and args.frame == 'classic':
+        parser.error('--boxes unlabeled needs the explanatory frame axioms')
+    for spec in args.solvers or []:
+        try:
+            lib.satsolver.backend(spec)
+        except ValueError:
+            parser.error('unknown SAT solver: {}'.format(spec))
 
-if len(sys.argv) == 3:
     try:
-        limit = int(sys.argv[2])
-        if limit > 0:
-            ss.set_limit(limit)
-            print('Limit set to {}'.format(limit))
-        else:
-            raise Exception()
-    except ValueError:
-        print('Limit must be an integer. Continuing with default limit.')
-    except Exception:
-        print('Limit must be greater than zero. Continuing with default limit.')
-
-ss.solve()
+        levels = Level.load(args.map)
+    except (OSError, ValueError) as e:
+        parser.error('cannot load {}: {}'.format(args.map, e))
+    if not 1 <= args.level <= len(levels):
+        parser.error('{} has {} levels, no level {}'.format(args.map, len(levels), args.level))
+    level = levels[args.level-1]
+
+    solvers = []
+    if args.backend in ('search', 'race'):
+        solvers.append(SokobanSearch(level, algorithm=args.algorithm, metric=args.metric,
+                                     prune_dead=args.prune_dead, cache=args.cache,
+                                     cache_size=args.cache_size * 2**20))
+    if args.backend in ('sat', 'race'):
+        solvers.append(SokobanSolver(level, encoding=args.encoding, incremental=args.incremental,
+                                     jobs=args.jobs, schedule=args.schedule, minimal=args.minimal,
+                                     cardinality=args.cardinality, frame=args.frame, prune_dead=args.prune_dead,
+                                     reachability=args.reachability, lower_bound=args.lower_bound,
+                                     boxes=args.boxes, semantics=args.semantics,
+                                     encode_jobs=args.encode_jobs, solvers=args.solvers or ['minisat'],
+                                     profile=args.profile, cache=args.cache,
+                                     cache_size=args.cache_size * 2**20))
+
+    if args.limit is not None:
+        try:
+            limit = int(args.limit)
+            if limit > 0:
+                for ss in solvers:
+                    ss.set_limit(limit)
+                print('Limit set to {}'.format(limit))
+            else:
+                raise Exception()
+        except ValueError:
+            print('Limit must be an integer. Continuing with default limit.')
+        except Exception:
+            print('Limit must be greater than zero. Continuing with default limit.')
+
+    if len(solvers) == 1:
+        solvers[0].solve()
+        return
+    for ss in solvers:
+        ss.close()
+    print('Racing the search and SAT backends ...')
+    backend, result = batch.race(level, [('search', solvers[0].options()), ('sat', solvers[1].options())],
+                                 solvers[0].LIMIT)
+    print('DONE')
+    if result['status'] == 'solved':
+        print('Solution found by the {} backend, actions:'.format(backend))
+        for action in result['plan']:
+            print(action)
+    elif result['status'] == 'limit':
+        print('Solution not found. Limit of steps reached ({})'.format(solvers[0].LIMIT))
+    else:
+        print('Solution not found: {}'.format(result.get('message', result['status'])))
+
+if __name__ == '__main__':
+    main()